@@ -0,0 +1,385 @@
+"""Export tables as NDJSON or CSV, and import such files back.
+
+    python archive.py export projects [--format csv] [--gzip] [-o projects.csv.gz]
+    python archive.py import projects projects.csv.gz [--format csv]
+
+Exports stream rows through a server-side cursor, so memory stays flat
+whatever the table size. Drafts are exported with their full text and
+re-encoded (snapshots and deltas) on import. Import projects before the
+tables that reference them; rows whose id or unique key already exists
+are skipped, so re-importing the same file is harmless.
+"""
+import argparse
+import csv
+import gzip
+import io
+import json
+import os
+import sys
+import zlib
+from datetime import datetime
+
+from sqlalchemy import func, select, text, update
+from sqlalchemy.exc import IntegrityError
+
+from database import SessionLocal, dialect_insert
+from models import PaperDraft, PlagiarismJob, ProjectMember, ResearchProject, Review
+import drafts
+import scores
+import storage
+
+EXPORT_BATCH_SIZE = int(os.getenv("EXPORT_BATCH_SIZE", "1000"))
+IMPORT_BATCH_SIZE = int(os.getenv("IMPORT_BATCH_SIZE", "1000"))
+
+# Output is handed to the client in chunks of about this size
+CHUNK_BYTES = 64 * 1024
+
+FORMATS = {"ndjson": "application/x-ndjson", "csv": "text/csv"}
+
+# In import order: projects first, everything else references them
+TABLES = {
+    "projects": ResearchProject,
+    "members": ProjectMember,
+    "drafts": PaperDraft,
+    "reviews": Review,
+    "jobs": PlagiarismJob,
+}
+
+
+def table_columns(model, exclude=()) -> list[str]:
+    return [column.name for column in model.__table__.columns if column.name not in exclude]
+
+
+COLUMNS = {
+    # last_draft_version is recomputed when drafts are imported
+    "projects": table_columns(ResearchProject, exclude={"last_draft_version"}),
+    "members": table_columns(ProjectMember),
+    "drafts": ["id", "project_id", "version", "created_by", "created_at", "content"],
+    "reviews": table_columns(Review),
+    # Leases belong to the process that held them, not to the data
+    "jobs": table_columns(PlagiarismJob, exclude={"lease_owner", "lease_expires_at"}),
+}
+
+
+def file_format(filename: str) -> str:
+    name = filename.lower().removesuffix(".gz")
+    return "csv" if name.endswith(".csv") else "ndjson"
+
+
+def export_filename(table: str, fmt: str, compress: bool) -> str:
+    return f"{table}.{fmt}" + (".gz" if compress else "")
+
+
+# ----------------------------------------
+# Export
+# ----------------------------------------
+def streamed(session, query):
+    return session.execute(query.execution_options(yield_per=EXPORT_BATCH_SIZE))
+
+
+def table_rows(session, table: str):
+    model = TABLES[table]
+    columns = [model.__table__.c[name] for name in COLUMNS[table]]
+    yield from streamed(session, select(*columns).order_by(model.id))
+
+
+def draft_rows(session):
+    query = (
+        select(
+            PaperDraft.id,
+            PaperDraft.project_id,
+            PaperDraft.version,
+            PaperDraft.created_by,
+            PaperDraft.created_at,
+            PaperDraft.storage,
+            PaperDraft.base_version,
+            PaperDraft.payload,
+            PaperDraft.content,
+        )
+        .order_by(PaperDraft.project_id, PaperDraft.version)
+    )
+
+    # A delta's base is the previous stored version of the same project,
+    # so only that one text is kept while walking the table
+    project_id, known = None, {}
+    for row in streamed(session, query):
+        if row.project_id != project_id:
+            project_id, known = row.project_id, {}
+        content = drafts.materialize([row], known)[row.version]
+        known = {row.version: content}
+        yield row.id, row.project_id, row.version, row.created_by, row.created_at, content
+
+
+def json_default(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+
+def ndjson_lines(columns, rows):
+    for row in rows:
+        yield json.dumps(dict(zip(columns, row)), default=json_default, ensure_ascii=False) + "\n"
+
+
+def csv_lines(columns, rows):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(columns)
+    for row in rows:
+        writer.writerow(row)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    yield buffer.getvalue()
+
+
+def chunked(lines, compress: bool):
+    # wbits=31 writes a gzip container rather than a raw zlib stream
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31) if compress else None
+    pending, size = [], 0
+
+    def flush():
+        data = "".join(pending).encode("utf-8")
+        return compressor.compress(data) if compressor else data
+
+    for line in lines:
+        pending.append(line)
+        size += len(line)
+        if size >= CHUNK_BYTES:
+            data = flush()
+            pending, size = [], 0
+            if data:
+                yield data
+
+    data = flush()
+    if compressor:
+        data += compressor.flush()
+    if data:
+        yield data
+
+
+def export_table(session, table: str, fmt: str = "ndjson", compress: bool = False):
+    """The table encoded as fmt, as an iterator of byte chunks."""
+    rows = draft_rows(session) if table == "drafts" else table_rows(session, table)
+    lines = csv_lines if fmt == "csv" else ndjson_lines
+    return chunked(lines(COLUMNS[table], rows), compress)
+
+
+def stream_export(table: str, fmt: str = "ndjson", compress: bool = False):
+    # Owns its session: the response body outlives the request's
+    with SessionLocal() as session:
+        yield from export_table(session, table, fmt, compress)
+
+
+# ----------------------------------------
+# Import
+# ----------------------------------------
+def open_text(stream):
+    """Text reader over a binary stream, gunzipping it if needed."""
+    start = stream.read(2)
+    stream.seek(0)
+    if start == b"\x1f\x8b":
+        stream = gzip.GzipFile(fileobj=stream, mode="rb")
+    return io.TextIOWrapper(stream, encoding="utf-8", newline="")
+
+
+def read_records(stream, fmt: str):
+    reader = open_text(stream)
+    if fmt == "csv":
+        yield from csv.DictReader(reader)
+        return
+    for line in reader:
+        if line.strip():
+            yield json.loads(line)
+
+
+def coerce(column, value):
+    # CSV carries every value as text and cannot tell "" from NULL
+    if value is None or (value == "" and column.nullable):
+        return None
+    kind = column.type.python_type
+    if not isinstance(value, str) or kind is str:
+        return value
+    if kind is datetime:
+        return datetime.fromisoformat(value)
+    if kind is bool:
+        return value.lower() in ("1", "true")
+    return kind(value)
+
+
+def coerce_row(columns, row: dict) -> dict:
+    return {name: coerce(columns[name], value) for name, value in row.items()}
+
+
+def job_row(row: dict) -> dict:
+    # Paths are later opened by the worker and served to users, so they
+    # must point into the upload store
+    for name in ("file_path", "report_path"):
+        if row[name] is not None and not storage.is_stored_path(row[name]):
+            raise ValueError(f"{name} is outside the upload directory")
+    if row["status"] == "processing":
+        row["status"] = "queued"
+    return row
+
+
+def parse_records(records, table: str):
+    model_columns = TABLES[table].__table__.c
+    names = COLUMNS[table]
+    for number, record in enumerate(records, start=1):
+        try:
+            row = {name: record[name] for name in names}
+            if table == "drafts":
+                # Re-encoded into the storage columns by encoded_drafts
+                content = row.pop("content") or ""
+                yield {**coerce_row(model_columns, row), "content": content}
+            elif table == "jobs":
+                yield job_row(coerce_row(model_columns, row))
+            else:
+                yield coerce_row(model_columns, row)
+        except KeyError as exc:
+            raise ValueError(f"Record {number}: missing field {exc.args[0]}")
+        except (TypeError, ValueError) as exc:
+            raise ValueError(f"Record {number}: {exc}")
+
+
+def batches(rows, size: int = IMPORT_BATCH_SIZE):
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def encoded_drafts(session, rows):
+    """Draft records -> paper_drafts rows, delta-encoded per project.
+
+    Records of a project must be contiguous and in version order, as
+    exported. Projects that already have drafts are skipped entirely, so
+    an imported delta never points at a version that was not imported.
+    """
+    project_id, existing, previous = None, False, None
+    for row in rows:
+        if row["project_id"] != project_id:
+            project_id, previous = row["project_id"], None
+            existing = session.scalar(
+                select(PaperDraft.id).where(PaperDraft.project_id == project_id).limit(1)
+            ) is not None
+        if existing:
+            continue
+
+        content = row.pop("content")
+        if previous is not None and previous[0] >= row["version"]:
+            raise ValueError(f"Drafts of project {project_id} are not in version order")
+
+        encoded = drafts.encode_version(row["version"], content, previous)
+        snapshot_version = previous[2] if encoded["storage"] == drafts.DELTA else row["version"]
+        previous = (row["version"], content, snapshot_version)
+        yield {**row, **encoded}
+
+
+def count(session, model) -> int:
+    return session.scalar(select(func.count()).select_from(model))
+
+
+def resync_sequence(session, model):
+    # Explicit ids don't advance a PostgreSQL serial
+    if session.get_bind().dialect.name == "postgresql":
+        table = model.__tablename__
+        session.execute(text(
+            f"SELECT setval(pg_get_serial_sequence('{table}', 'id'), "
+            f"COALESCE((SELECT MAX(id) FROM {table}), 0) + 1, false)"
+        ))
+
+
+def import_table(session, table: str, stream, fmt: str = "ndjson") -> dict:
+    """Load an exported file into table in one transaction.
+
+    Returns the number of records read and imported; raises ValueError
+    (after rolling back) on a malformed record.
+    """
+    model = TABLES[table]
+    before = count(session, model)
+    statement = dialect_insert(model.__table__).on_conflict_do_nothing()
+
+    read = 0
+
+    def counted(rows):
+        nonlocal read
+        for row in rows:
+            read += 1
+            yield row
+
+    try:
+        rows = counted(parse_records(read_records(stream, fmt), table))
+        if table == "drafts":
+            rows = encoded_drafts(session, rows)
+        for batch in batches(rows):
+            session.execute(statement, batch)
+    except (UnicodeDecodeError, ValueError, csv.Error):
+        session.rollback()
+        raise
+    except IntegrityError as exc:
+        session.rollback()
+        raise ValueError(f"Rejected by the database: {exc.orig}")
+
+    if table == "drafts":
+        session.execute(
+            update(ResearchProject).values(
+                last_draft_version=drafts.max_version(ResearchProject.id)
+            )
+        )
+    if table == "reviews":
+        scores.rebuild_review_stats(session.connection())
+    resync_sequence(session, model)
+
+    imported = count(session, model) - before
+    session.commit()
+    return {"table": table, "imported": imported, "skipped": read - imported}
+
+
+def import_upload(table: str, stream, fmt: str) -> dict:
+    with SessionLocal() as session:
+        return import_table(session, table, stream, fmt)
+
+
+if __name__ == "__main__":
+    from database import engine
+    import models
+    import migrations
+
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    export_parser = commands.add_parser("export")
+    export_parser.add_argument("table", choices=TABLES)
+    export_parser.add_argument("--format", choices=FORMATS)
+    export_parser.add_argument("--gzip", action="store_true")
+    export_parser.add_argument("-o", "--output")
+
+    import_parser = commands.add_parser("import")
+    import_parser.add_argument("table", choices=TABLES)
+    import_parser.add_argument("file")
+    import_parser.add_argument("--format", choices=FORMATS)
+
+    args = parser.parse_args()
+
+    models.Base.metadata.create_all(bind=engine)
+    migrations.run_migrations(engine)
+
+    if args.command == "export":
+        fmt = args.format or (file_format(args.output) if args.output else "ndjson")
+        output = open(args.output, "wb") if args.output else sys.stdout.buffer
+        with SessionLocal() as session, output:
+            for chunk in export_table(session, args.table, fmt, args.gzip):
+                output.write(chunk)
+    else:
+        fmt = args.format or file_format(args.file)
+        with SessionLocal() as session, open(args.file, "rb") as stream:
+            try:
+                result = import_table(session, args.table, stream, fmt)
+            except ValueError as exc:
+                sys.exit(f"Import failed: {exc}")
+        print(f"Imported {result['imported']} {args.table}, skipped {result['skipped']} existing")
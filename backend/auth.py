@@ -4,13 +4,30 @@ from jose import jwt
 from fastapi import HTTPException, Depends
 from jose import JWTError
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
+from typing import NamedTuple
+from cachetools import TTLCache
+from concurrent.futures import ThreadPoolExecutor
+from sqlalchemy import and_, select
+from sqlalchemy.ext.asyncio import AsyncSession
+import asyncio
+import os
+import threading
+
+from database import get_db
+from models import ProjectMember, ResearchProject, User
 
 
 
 # Password hashing
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+
+# Hashes below the configured cost are flagged by needs_update and
+# upgraded on the next successful login
 pwd_context = CryptContext(
     schemes=["bcrypt"],
     deprecated="auto",
+    bcrypt__default_rounds=BCRYPT_ROUNDS,
+    bcrypt__min_rounds=BCRYPT_ROUNDS,
 )
 
 SECRET_KEY = "ACADFLOW_SECRET_KEY_CHANGE_LATER"
@@ -28,6 +45,61 @@ def verify_password(plain_password: str, hashed_password: str) -> bool:
     return pwd_context.verify(plain_password, hashed_password)
 
 
+def verify_and_update_password(plain_password: str, hashed_password: str):
+    """Returns (valid, new_hash); new_hash is set when the stored hash is stale."""
+    return pwd_context.verify_and_update(plain_password, hashed_password)
+
+
+# ----------------------------------------
+# Password hashing pool
+# ----------------------------------------
+# bcrypt releases the GIL, so a small dedicated thread pool keeps hashing
+# off the request threadpool without the cost of a process pool
+HASH_WORKERS = int(os.getenv("HASH_WORKERS", str(os.cpu_count() or 2)))
+HASH_QUEUE_SIZE = int(os.getenv("HASH_QUEUE_SIZE", "64"))
+HASH_RETRY_AFTER = int(os.getenv("HASH_RETRY_AFTER", "2"))
+
+
+class HashingPool:
+    def __init__(self, workers: int, queue_size: int):
+        self.capacity = workers + queue_size
+        self._executor = ThreadPoolExecutor(
+            max_workers=workers, thread_name_prefix="bcrypt"
+        )
+        self._pending = 0
+        self._lock = threading.Lock()
+
+    async def run(self, func, *args):
+        with self._lock:
+            if self._pending >= self.capacity:
+                raise HTTPException(
+                    status_code=503,
+                    detail="Authentication is busy, please retry",
+                    headers={"Retry-After": str(HASH_RETRY_AFTER)},
+                )
+            self._pending += 1
+
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._executor, func, *args)
+        finally:
+            with self._lock:
+                self._pending -= 1
+
+
+hashing_pool = HashingPool(HASH_WORKERS, HASH_QUEUE_SIZE)
+
+
+async def hash_password_async(password: str) -> str:
+    return await hashing_pool.run(hash_password, password)
+
+
+async def verify_and_update_password_async(plain_password: str, hashed_password: str):
+    return await hashing_pool.run(
+        verify_and_update_password, plain_password, hashed_password
+    )
+
+
 def create_access_token(data: dict, expires_delta: timedelta | None = None):
     to_encode = data.copy()
     expire = datetime.utcnow() + (expires_delta or timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES))
@@ -53,3 +125,160 @@ def get_current_user(
         return email
     except JWTError:
         raise HTTPException(status_code=401, detail="Invalid or expired token")
+
+
+# ----------------------------------------
+# Resolved principals
+# ----------------------------------------
+class Principal(NamedTuple):
+    id: int
+    email: str
+    name: str
+    role: str
+
+
+PRINCIPAL_CACHE_SIZE = int(os.getenv("PRINCIPAL_CACHE_SIZE", "4096"))
+PRINCIPAL_CACHE_TTL = int(os.getenv("PRINCIPAL_CACHE_TTL", "60"))
+
+# Keyed by token subject; the TTL bounds how long another worker process
+# can keep serving a role that was changed elsewhere
+_principal_cache = TTLCache(maxsize=PRINCIPAL_CACHE_SIZE, ttl=PRINCIPAL_CACHE_TTL)
+_principal_lock = threading.Lock()
+
+
+def invalidate_principal(email: str):
+    with _principal_lock:
+        _principal_cache.pop(email, None)
+
+
+async def get_current_principal(
+    email: str = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db),
+) -> Principal:
+    with _principal_lock:
+        principal = _principal_cache.get(email)
+    if principal is not None:
+        return principal
+
+    row = (
+        await db.execute(
+            select(User.id, User.email, User.name, User.role).where(
+                User.email == email
+            )
+        )
+    ).first()
+
+    if row is None:
+        raise HTTPException(status_code=404, detail="User not found")
+
+    principal = Principal(*row)
+    with _principal_lock:
+        _principal_cache[email] = principal
+    return principal
+
+
+# ----------------------------------------
+# Project access
+# ----------------------------------------
+class ProjectACL(NamedTuple):
+    project_id: int
+    owner_id: int
+    visibility: str
+    members: frozenset  # user ids of accepted members
+
+
+class ProjectAccess(NamedTuple):
+    user: Principal
+    project: ProjectACL
+    permission: str  # owner | member | faculty | none
+
+    @property
+    def is_member(self) -> bool:
+        return self.permission in ("owner", "member")
+
+
+PROJECT_ACL_CACHE_SIZE = int(os.getenv("PROJECT_ACL_CACHE_SIZE", "4096"))
+PROJECT_ACL_CACHE_TTL = int(os.getenv("PROJECT_ACL_CACHE_TTL", "60"))
+
+# Invalidated by invite, respond and visibility changes in this process;
+# the TTL bounds staleness across worker processes
+_acl_cache = TTLCache(maxsize=PROJECT_ACL_CACHE_SIZE, ttl=PROJECT_ACL_CACHE_TTL)
+_acl_lock = threading.Lock()
+
+
+def invalidate_project(project_id: int):
+    with _acl_lock:
+        _acl_cache.pop(project_id, None)
+
+
+def invalidate_all_projects():
+    with _acl_lock:
+        _acl_cache.clear()
+
+
+async def get_project_acl(db, project_id: int) -> ProjectACL | None:
+    with _acl_lock:
+        acl = _acl_cache.get(project_id)
+    if acl is not None:
+        return acl
+
+    # The project and all its accepted members in one query
+    rows = (
+        await db.execute(
+            select(
+                ResearchProject.id,
+                ResearchProject.owner_id,
+                ResearchProject.visibility,
+                ProjectMember.user_id,
+            )
+            .outerjoin(
+                ProjectMember,
+                and_(
+                    ProjectMember.project_id == ResearchProject.id,
+                    ProjectMember.is_accepted == True,
+                ),
+            )
+            .where(ResearchProject.id == project_id)
+        )
+    ).all()
+
+    if not rows:
+        return None
+
+    project_id, owner_id, visibility, _ = rows[0]
+    acl = ProjectACL(
+        project_id,
+        owner_id,
+        visibility,
+        frozenset(row[3] for row in rows if row[3] is not None),
+    )
+    with _acl_lock:
+        _acl_cache[project_id] = acl
+    return acl
+
+
+def project_permission(acl: ProjectACL, user: Principal) -> str:
+    if acl.owner_id == user.id:
+        return "owner"
+    if user.id in acl.members:
+        return "member"
+    if user.role == "faculty":
+        return "faculty"
+    return "none"
+
+
+async def resolve_project_access(db, project_id: int, user: Principal) -> ProjectAccess:
+    """For endpoints that take the project id in the body; raises 404 for
+    unknown projects."""
+    acl = await get_project_acl(db, project_id)
+    if acl is None:
+        raise HTTPException(status_code=404, detail="Project not found")
+    return ProjectAccess(user, acl, project_permission(acl, user))
+
+
+async def get_project_access(
+    project_id: int,
+    user: Principal = Depends(get_current_principal),
+    db: AsyncSession = Depends(get_db),
+) -> ProjectAccess:
+    return await resolve_project_access(db, project_id, user)
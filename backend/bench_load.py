@@ -0,0 +1,488 @@
+"""Load and latency benchmark of the API, in-process over ASGI.
+
+    python bench_load.py run [--clients 16] [--requests 2000] [-o result.json]
+    python bench_load.py compare baseline.json result.json [--threshold 0.10]
+
+run seeds a synthetic dataset (users, projects, memberships, drafts,
+reviews, plagiarism jobs) into a temporary SQLite file, then drives
+main.app with concurrent clients over a weighted mix of routes:
+
+  login          POST /login (bcrypt at the configured BCRYPT_ROUNDS)
+  create_draft   POST /drafts
+  drafts         GET /projects/{project_id}/drafts?limit=20
+  public         GET /projects/public
+  reviews        GET /projects/{project_id}/reviews
+
+and writes throughput and p50/p95/p99 latency per route as JSON. The
+dataset and the request sequence depend only on the options and --seed,
+so two runs with the same options exercise the same work.
+
+compare prints the change of every route between two results and exits
+with status 1 if any latency percentile or throughput regressed by more
+than the threshold. Tail percentiles need a few thousand requests per
+route to be stable enough to compare.
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from datetime import datetime, timedelta
+
+PASSWORD = "bench-password"
+
+DOMAINS = ("ml", "bio", "physics", "chemistry", "economics", "linguistics")
+
+WORDS = (
+    "graph neural network model data analysis method result evaluation "
+    "protein sequence energy market language corpus sample experiment "
+    "baseline training inference signal structure estimate variance error "
+    "theory observation dataset feature layer attention gradient kernel"
+).split()
+
+DEFAULT_MIX = "login=1,create_draft=2,drafts=4,public=4,reviews=3"
+
+
+# ----------------------------------------
+# Synthetic data
+# ----------------------------------------
+def sentence(rng: random.Random, words: int) -> str:
+    return " ".join(rng.choice(WORDS) for _ in range(words)).capitalize() + "."
+
+
+def paragraphs(project_id: int, size: int) -> list[str]:
+    rng = random.Random(project_id)
+    lines, total = [], 0
+    while total < size:
+        line = " ".join(sentence(rng, rng.randint(8, 20)) for _ in range(3)) + "\n"
+        lines.append(line)
+        total += len(line)
+    return lines
+
+
+def draft_text(base: list[str], version: int) -> str:
+    # Each version rewrites one paragraph of the project's base text, so
+    # consecutive versions differ by a few lines like real edits do
+    lines = list(base)
+    lines[(version * 7) % len(lines)] = f"Revision {version}: {lines[0]}"
+    return "".join(lines)
+
+
+def batched(rows, size: int = 2000):
+    for start in range(0, len(rows), size):
+        yield rows[start:start + size]
+
+
+def seed(session, args) -> dict:
+    """Fill an empty database; returns what the clients need to know."""
+    from sqlalchemy import insert
+
+    from auth import hash_password
+    from models import PaperDraft, PlagiarismJob, ProjectMember, ResearchProject, Review, User
+    import drafts
+    import scores
+
+    rng = random.Random(args.seed)
+    hashed = hash_password(PASSWORD)
+
+    reviewers = max(1, args.users // 10)
+    users = [
+        {
+            "id": user_id,
+            "name": f"User {user_id}",
+            "email": f"user{user_id}@bench.acadflow.org",
+            "hashed_password": hashed,
+            "role": "reviewer" if user_id <= reviewers else "student",
+        }
+        for user_id in range(1, args.users + 1)
+    ]
+    students = [user["id"] for user in users if user["role"] == "student"]
+    reviewer_ids = [user["id"] for user in users if user["role"] == "reviewer"]
+
+    projects, owned = [], defaultdict(list)
+    for project_id in range(1, args.projects + 1):
+        owner_id = students[(project_id - 1) % len(students)]
+        owned[owner_id].append(project_id)
+        projects.append({
+            "id": project_id,
+            "title": sentence(rng, 6),
+            "abstract": " ".join(sentence(rng, 15) for _ in range(4)),
+            "domain": rng.choice(DOMAINS),
+            "visibility": "public" if rng.random() < 0.7 else "private",
+            "owner_id": owner_id,
+            "last_draft_version": args.drafts,
+        })
+
+    members = []
+    for project in projects:
+        others = [user_id for user_id in students if user_id != project["owner_id"]]
+        for user_id in rng.sample(others, min(args.members, len(others))):
+            members.append({
+                "project_id": project["id"],
+                "user_id": user_id,
+                "role": "co-author",
+                "is_accepted": rng.random() < 0.8,
+            })
+
+    start = datetime(2024, 1, 1)
+    reviews = []
+    for project in projects:
+        if project["visibility"] != "public":
+            continue
+        for reviewer_id in rng.sample(reviewer_ids, min(args.reviews, len(reviewer_ids))):
+            reviews.append({
+                "project_id": project["id"],
+                "reviewer_id": reviewer_id,
+                "score": rng.randint(1, 5),
+                "comments": " ".join(sentence(rng, 12) for _ in range(3)),
+                "created_at": start + timedelta(minutes=len(reviews)),
+            })
+
+    jobs = []
+    for job in range(args.jobs):
+        project = rng.choice(projects)
+        jobs.append({
+            "user_id": project["owner_id"],
+            "project_id": project["id"],
+            "file_path": f"uploads/submissions/{job:064x}.pdf",
+            "content_hash": f"{job:064x}",
+            "status": rng.choice(("queued", "completed", "completed", "failed")),
+            "similarity": rng.random(),
+            "created_at": start + timedelta(minutes=job),
+        })
+
+    for model, rows in (
+        (User, users),
+        (ResearchProject, projects),
+        (ProjectMember, members),
+        (Review, reviews),
+        (PlagiarismJob, jobs),
+    ):
+        for batch in batched(rows):
+            session.execute(insert(model), batch)
+
+    draft_rows = 0
+    for project in projects:
+        base = paragraphs(project["id"], args.draft_size)
+        rows, previous = [], None
+        for version in range(1, args.drafts + 1):
+            content = draft_text(base, version)
+            encoded = drafts.encode_version(version, content, previous)
+            snapshot_version = previous[2] if encoded["storage"] == drafts.DELTA else version
+            previous = (version, content, snapshot_version)
+            rows.append({
+                "project_id": project["id"],
+                "created_by": project["owner_id"],
+                "version": version,
+                "created_at": start + timedelta(hours=version),
+                **encoded,
+            })
+        if rows:
+            session.execute(insert(PaperDraft), rows)
+            draft_rows += len(rows)
+
+    scores.rebuild_review_stats(session.connection())
+    session.commit()
+
+    return {
+        "owners": {user_id: project_ids for user_id, project_ids in owned.items()},
+        "rows": {
+            "users": len(users),
+            "projects": len(projects),
+            "members": len(members),
+            "drafts": draft_rows,
+            "reviews": len(reviews),
+            "jobs": len(jobs),
+        },
+    }
+
+
+# ----------------------------------------
+# Workload
+# ----------------------------------------
+class Client:
+    def __init__(self, http, user_id: int, project_ids, rng: random.Random, draft_size: int):
+        from auth import create_access_token
+
+        self.http = http
+        self.email = f"user{user_id}@bench.acadflow.org"
+        self.project_ids = project_ids
+        self.rng = rng
+        self.draft_size = draft_size
+        self.edits = 0
+        token = create_access_token({"sub": self.email}, timedelta(hours=12))
+        self.headers = {"Authorization": f"Bearer {token}"}
+
+    def project(self) -> int:
+        return self.rng.choice(self.project_ids)
+
+    def request(self, operation: str):
+        """(route, method, url, kwargs) for one operation."""
+        if operation == "login":
+            return "POST /login", "POST", "/login", {
+                "json": {"email": self.email, "password": PASSWORD},
+            }
+        if operation == "create_draft":
+            project_id = self.project()
+            self.edits += 1
+            content = draft_text(paragraphs(project_id, self.draft_size), 1000 + self.edits)
+            return "POST /drafts", "POST", "/drafts", {
+                "json": {"project_id": project_id, "content": content},
+                "headers": self.headers,
+            }
+        if operation == "drafts":
+            return (
+                "GET /projects/{project_id}/drafts",
+                "GET",
+                f"/projects/{self.project()}/drafts",
+                {"params": {"limit": 20}, "headers": self.headers},
+            )
+        if operation == "public":
+            return "GET /projects/public", "GET", "/projects/public", {"headers": self.headers}
+        if operation == "reviews":
+            return (
+                "GET /projects/{project_id}/reviews",
+                "GET",
+                f"/projects/{self.project()}/reviews",
+                {"headers": self.headers},
+            )
+        raise ValueError(f"Unknown operation {operation}")
+
+
+def parse_mix(mix: str) -> dict:
+    weights = {}
+    for item in mix.split(","):
+        name, _, weight = item.partition("=")
+        weights[name.strip()] = float(weight or 1)
+    return weights
+
+
+async def drive(clients, mix: dict, total: int, samples):
+    operations, weights = list(mix), list(mix.values())
+
+    # Fixed per-client quotas keep the request sequence independent of
+    # scheduling
+    quotas = [
+        total // len(clients) + (index < total % len(clients))
+        for index in range(len(clients))
+    ]
+
+    async def loop(client, quota: int):
+        for _ in range(quota):
+            route, method, url, kwargs = client.request(
+                client.rng.choices(operations, weights)[0]
+            )
+            started = time.perf_counter()
+            response = await client.http.request(method, url, **kwargs)
+            elapsed = time.perf_counter() - started
+            if samples is not None:
+                samples[route].append((elapsed, response.status_code))
+
+    started = time.perf_counter()
+    await asyncio.gather(*(loop(client, quota) for client, quota in zip(clients, quotas)))
+    return time.perf_counter() - started
+
+
+def percentile(sorted_values, fraction: float) -> float:
+    # Linear interpolation between the closest ranks
+    if len(sorted_values) == 1:
+        return sorted_values[0]
+    position = (len(sorted_values) - 1) * fraction
+    lower = int(position)
+    upper = min(lower + 1, len(sorted_values) - 1)
+    return sorted_values[lower] + (sorted_values[upper] - sorted_values[lower]) * (position - lower)
+
+
+def route_stats(samples, elapsed: float) -> dict:
+    latencies = sorted(latency * 1000 for latency, _ in samples)
+    statuses = defaultdict(int)
+    for _, status in samples:
+        statuses[str(status)] += 1
+    return {
+        "requests": len(samples),
+        "errors": sum(count for status, count in statuses.items() if int(status) >= 400),
+        "statuses": dict(sorted(statuses.items())),
+        "throughput_rps": round(len(samples) / elapsed, 2),
+        "mean_ms": round(statistics.fmean(latencies), 3),
+        "p50_ms": round(percentile(latencies, 0.50), 3),
+        "p95_ms": round(percentile(latencies, 0.95), 3),
+        "p99_ms": round(percentile(latencies, 0.99), 3),
+        "max_ms": round(latencies[-1], 3),
+    }
+
+
+async def benchmark(app, dataset: dict, args) -> tuple[float, dict]:
+    import httpx
+
+    owners = sorted(dataset["owners"].items())
+    rng = random.Random(args.seed)
+    chosen = rng.sample(owners, min(args.clients, len(owners)))
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as http:
+        clients = [
+            Client(http, user_id, project_ids, random.Random(args.seed + index), args.draft_size)
+            for index, (user_id, project_ids) in enumerate(chosen)
+        ]
+        mix = parse_mix(args.mix)
+
+        await drive(clients, mix, args.warmup, None)
+        samples = defaultdict(list)
+        elapsed = await drive(clients, mix, args.requests, samples)
+
+    return elapsed, samples
+
+
+def run(args) -> dict:
+    workdir = tempfile.mkdtemp(prefix="acadflow-bench-")
+    # main reads its configuration at import time
+    os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(workdir, 'bench.db')}"
+    os.environ.pop("ASYNC_DATABASE_URL", None)
+    os.environ["UPLOAD_ROOT"] = os.path.join(workdir, "uploads")
+    os.environ.setdefault("PLAGIARISM_INLINE_JOBS", "0")
+
+    try:
+        import main
+        from database import DB_MODE, SessionLocal
+        import auth
+
+        started = time.perf_counter()
+        with SessionLocal() as session:
+            dataset = seed(session, args)
+        seed_seconds = time.perf_counter() - started
+
+        elapsed, samples = asyncio.run(benchmark(main.app, dataset, args))
+    finally:
+        if not args.keep:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    all_samples = [sample for route in samples.values() for sample in route]
+    return {
+        "config": {
+            "clients": args.clients,
+            "requests": args.requests,
+            "warmup": args.warmup,
+            "mix": parse_mix(args.mix),
+            "seed": args.seed,
+            "db_mode": DB_MODE,
+            "bcrypt_rounds": auth.BCRYPT_ROUNDS,
+        },
+        "environment": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+        },
+        "dataset": {**dataset["rows"], "draft_size": args.draft_size, "seed_seconds": round(seed_seconds, 2)},
+        "elapsed_seconds": round(elapsed, 3),
+        "total": route_stats(all_samples, elapsed),
+        "routes": {route: route_stats(samples[route], elapsed) for route in sorted(samples)},
+    }
+
+
+# ----------------------------------------
+# Comparing runs
+# ----------------------------------------
+LATENCY_METRICS = ("p50_ms", "p95_ms", "p99_ms")
+
+
+def compare(baseline: dict, result: dict, threshold: float, min_ms: float) -> list[dict]:
+    """One entry per route and metric; regression=True where result is
+    worse than baseline by more than threshold (and min_ms for latency)."""
+    changes = []
+    routes = {"total": (baseline["total"], result["total"])}
+    for route, stats in result["routes"].items():
+        if route in baseline["routes"]:
+            routes[route] = (baseline["routes"][route], stats)
+
+    for route, (before, after) in routes.items():
+        for metric in LATENCY_METRICS + ("throughput_rps",):
+            old, new = before[metric], after[metric]
+            change = (new - old) / old if old else 0.0
+            if metric == "throughput_rps":
+                regression = change < -threshold
+            else:
+                regression = change > threshold and new - old > min_ms
+            changes.append({
+                "route": route,
+                "metric": metric,
+                "baseline": old,
+                "result": new,
+                "change": round(change, 4),
+                "regression": regression,
+            })
+    return changes
+
+
+def print_summary(result: dict):
+    print(f"{'route':<38} {'req':>6} {'err':>5} {'rps':>9} {'p50':>9} {'p95':>9} {'p99':>9}", file=sys.stderr)
+    for route, stats in {**result["routes"], "total": result["total"]}.items():
+        print(
+            f"{route:<38} {stats['requests']:>6} {stats['errors']:>5} {stats['throughput_rps']:>9.1f} "
+            f"{stats['p50_ms']:>9.2f} {stats['p95_ms']:>9.2f} {stats['p99_ms']:>9.2f}",
+            file=sys.stderr,
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = commands.add_parser("run")
+    run_parser.add_argument("--users", type=int, default=200)
+    run_parser.add_argument("--projects", type=int, default=500)
+    run_parser.add_argument("--members", type=int, default=2, help="per project")
+    run_parser.add_argument("--drafts", type=int, default=10, help="versions per project")
+    run_parser.add_argument("--draft-size", type=int, default=12000, help="bytes")
+    run_parser.add_argument("--reviews", type=int, default=3, help="per public project")
+    run_parser.add_argument("--jobs", type=int, default=1000)
+    run_parser.add_argument("--clients", type=int, default=16)
+    run_parser.add_argument("--requests", type=int, default=2000)
+    run_parser.add_argument("--warmup", type=int, default=200)
+    run_parser.add_argument("--mix", default=DEFAULT_MIX)
+    run_parser.add_argument("--seed", type=int, default=1)
+    run_parser.add_argument("--keep", action="store_true", help="keep the temporary database")
+    run_parser.add_argument("-o", "--output")
+
+    compare_parser = commands.add_parser("compare")
+    compare_parser.add_argument("baseline")
+    compare_parser.add_argument("result")
+    compare_parser.add_argument("--threshold", type=float, default=0.10)
+    compare_parser.add_argument("--min-ms", type=float, default=0.5,
+                                help="ignore latency changes smaller than this")
+    compare_parser.add_argument("--json", action="store_true")
+
+    args = parser.parse_args()
+
+    if args.command == "run":
+        result = run(args)
+        print_summary(result)
+        output = json.dumps(result, indent=2)
+        if args.output:
+            with open(args.output, "w") as f:
+                f.write(output + "\n")
+        else:
+            print(output)
+    else:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        with open(args.result) as f:
+            result = json.load(f)
+
+        changes = compare(baseline, result, args.threshold, args.min_ms)
+        regressions = [change for change in changes if change["regression"]]
+        if args.json:
+            print(json.dumps({"regressions": len(regressions), "changes": changes}, indent=2))
+        else:
+            for change in changes:
+                flag = "  REGRESSION" if change["regression"] else ""
+                print(
+                    f"{change['route']:<38} {change['metric']:<15} {change['baseline']:>10.2f} -> "
+                    f"{change['result']:>10.2f} {change['change']:>+8.1%}{flag}"
+                )
+        sys.exit(1 if regressions else 0)
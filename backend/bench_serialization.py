@@ -0,0 +1,143 @@
+"""Serialization cost of the list endpoints, per 1k rows.
+
+    python bench_serialization.py [--rows 5000] [--repeat 20]
+
+Runs against a throwaway in-memory SQLite database and times, for
+projects and plagiarism jobs:
+
+  orm + jsonable_encoder   ORM entities, FastAPI's generic encoder and
+                           json.dumps (the path of routes without a
+                           response model, and of older FastAPI releases)
+  orm + dump_json          ORM entities through a compiled TypeAdapter
+  rows + dump_json         column-tuple query through a compiled
+                           TypeAdapter (what the list endpoints do now)
+  rows + ORJSONResponse    the same rows the way FastAPI serializes them
+                           when ORJSONResponse is the default response
+                           class: dump_python, then orjson
+  rows + orjson            column tuples as dicts through orjson, without
+                           validation, for reference
+
+The orjson cases only run when orjson is installed.
+"""
+import argparse
+import json
+import time
+from datetime import datetime, timedelta
+
+from fastapi.encoders import jsonable_encoder
+from sqlalchemy import create_engine, select
+from sqlalchemy.orm import Session
+
+from database import Base
+from models import PlagiarismJob, ResearchProject, User
+from schemas import PlagiarismJobResponse, ProjectResponse
+import serialization
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def seed(session, rows: int):
+    owner = User(name="Owner", email="owner@example.com", hashed_password="x")
+    session.add(owner)
+    session.flush()
+
+    start = datetime(2024, 1, 1)
+    session.add_all(
+        ResearchProject(
+            title=f"Project {i}",
+            abstract="An abstract about graph neural networks. " * 8,
+            domain=("ml", "bio", "physics")[i % 3],
+            visibility="public",
+            owner_id=owner.id,
+        )
+        for i in range(rows)
+    )
+    session.flush()
+    session.add_all(
+        PlagiarismJob(
+            user_id=owner.id,
+            project_id=1 + i % rows,
+            file_path=f"uploads/submissions/{i:064x}.pdf",
+            content_hash=f"{i:064x}",
+            status=("queued", "completed", "failed")[i % 3],
+            similarity=(i % 100) / 100,
+            created_at=start + timedelta(minutes=i),
+        )
+        for i in range(rows)
+    )
+    session.commit()
+
+
+def timed(func, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - started)
+    return best
+
+
+def strategies(engine, entity, schema):
+    model = list[schema]
+    columns = serialization.columns(entity, schema)
+
+    def orm():
+        with Session(engine) as session:
+            return session.scalars(select(entity)).all()
+
+    def rows():
+        with Session(engine) as session:
+            return session.execute(select(*columns)).all()
+
+    def orm_encoder():
+        validated = [schema.model_validate(item) for item in orm()]
+        return json.dumps(jsonable_encoder(validated)).encode()
+
+    cases = {
+        "orm + jsonable_encoder": orm_encoder,
+        "orm + dump_json": lambda: serialization.dump_json(model, orm()),
+        "rows + dump_json": lambda: serialization.dump_json(model, rows()),
+    }
+    if orjson is not None:
+        compiled = serialization.adapter(model)
+        cases["rows + ORJSONResponse"] = lambda: orjson.dumps(compiled.dump_python(
+            compiled.validate_python(rows(), from_attributes=True), mode="json"
+        ))
+        cases["rows + orjson"] = lambda: orjson.dumps([row._asdict() for row in rows()])
+    return cases
+
+
+def run(rows: int, repeat: int) -> dict:
+    engine = create_engine("sqlite://")
+    Base.metadata.create_all(engine)
+    with Session(engine) as session:
+        seed(session, rows)
+
+    results = {}
+    for name, entity, schema in (
+        ("projects", ResearchProject, ProjectResponse),
+        ("plagiarism_jobs", PlagiarismJob, PlagiarismJobResponse),
+    ):
+        results[name] = {
+            case: round(timed(func, repeat) * 1000 * 1000 / rows, 3)
+            for case, func in strategies(engine, entity, schema).items()
+        }
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=5000)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    results = run(args.rows, args.repeat)
+    print(f"ms per 1k rows (best of {args.repeat}, {args.rows} rows, query included)")
+    for name, cases in results.items():
+        print(name)
+        baseline = cases["orm + jsonable_encoder"]
+        for case, cost in cases.items():
+            print(f"  {case:<24} {cost:>8.3f}  x{baseline / cost:.1f}")
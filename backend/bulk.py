@@ -0,0 +1,195 @@
+from sqlalchemy import insert, select, update
+from sqlalchemy.exc import IntegrityError
+
+from models import ProjectMember, ResearchProject, ReviewAssignment, User
+from schemas import BulkItemResult, BulkResult
+
+ROLES = ("student", "reviewer", "faculty")
+
+# A concurrent single-item write can still trip a unique index between
+# validation and insert; the batch is then revalidated and retried
+BULK_ATTEMPTS = 3
+
+
+def ok(index: int) -> BulkItemResult:
+    return BulkItemResult(index=index, status="ok")
+
+
+def error(index: int, detail: str) -> BulkItemResult:
+    return BulkItemResult(index=index, status="error", detail=detail)
+
+
+def summarize(results) -> BulkResult:
+    results = sorted(results, key=lambda result: result.index)
+    succeeded = sum(result.status == "ok" for result in results)
+    return BulkResult(
+        succeeded=succeeded,
+        failed=len(results) - succeeded,
+        results=results,
+    )
+
+
+def first_occurrences(keys):
+    """Split item indexes into first occurrences and in-batch duplicates."""
+    seen = {}
+    duplicates = []
+    for index, key in enumerate(keys):
+        if key in seen:
+            duplicates.append(error(index, "Duplicate in batch"))
+        else:
+            seen[key] = index
+    return seen, duplicates
+
+
+async def with_retries(db, attempt):
+    """Run attempt() (validate + write) until it commits; returns its
+    results."""
+    for _ in range(BULK_ATTEMPTS - 1):
+        try:
+            results = await attempt()
+            await db.commit()
+            return results
+        except IntegrityError:
+            await db.rollback()
+    results = await attempt()
+    await db.commit()
+    return results
+
+
+# ----------------------------------------
+# Invites
+# ----------------------------------------
+async def invite_members(db, project_id: int, emails) -> BulkResult:
+    """Invite many users to a project; the caller checks ownership."""
+    wanted, duplicates = first_occurrences(emails)
+
+    async def attempt():
+        users = dict(
+            (await db.execute(
+                select(User.email, User.id).where(User.email.in_(list(wanted)))
+            )).all()
+        )
+        existing = set(
+            (await db.scalars(
+                select(ProjectMember.user_id).where(
+                    ProjectMember.project_id == project_id,
+                    ProjectMember.user_id.in_(list(users.values())),
+                )
+            )).all()
+        )
+
+        results, rows = [], []
+        for email, index in wanted.items():
+            user_id = users.get(email)
+            if user_id is None:
+                results.append(error(index, "User not found"))
+            elif user_id in existing:
+                results.append(error(index, "User already invited or member"))
+            else:
+                results.append(ok(index))
+                rows.append({
+                    "project_id": project_id,
+                    "user_id": user_id,
+                    "role": "co-author",
+                    "is_accepted": False,
+                })
+
+        if rows:
+            await db.execute(insert(ProjectMember), rows)
+        return results
+
+    return summarize(duplicates + await with_retries(db, attempt))
+
+
+# ----------------------------------------
+# Roles
+# ----------------------------------------
+async def change_roles(db, changes):
+    """Returns (result, emails of the users whose role changed)."""
+    wanted, duplicates = first_occurrences(change.user_id for change in changes)
+
+    results = list(duplicates)
+    valid = {}
+    for user_id, index in wanted.items():
+        if changes[index].role not in ROLES:
+            results.append(error(index, "Invalid role"))
+        else:
+            valid[user_id] = index
+
+    users = dict(
+        (await db.execute(
+            select(User.id, User.email).where(User.id.in_(list(valid)))
+        )).all()
+    )
+
+    rows = []
+    for user_id, index in valid.items():
+        if user_id not in users:
+            results.append(error(index, "User not found"))
+        else:
+            results.append(ok(index))
+            rows.append({"id": user_id, "role": changes[index].role})
+
+    if rows:
+        # Bulk UPDATE by primary key, one statement for the batch
+        await db.execute(update(User), rows)
+        await db.commit()
+
+    return summarize(results), [users[row["id"]] for row in rows]
+
+
+# ----------------------------------------
+# Reviewer assignments
+# ----------------------------------------
+async def assign_reviewers(db, editor_id: int, assignments) -> BulkResult:
+    wanted, duplicates = first_occurrences(
+        (item.project_id, item.reviewer_email) for item in assignments
+    )
+    emails = {email for _, email in wanted}
+    project_ids = {project_id for project_id, _ in wanted}
+
+    async def attempt():
+        reviewer_ids = dict(
+            (await db.execute(
+                select(User.email, User.id).where(
+                    User.email.in_(list(emails)),
+                    User.role == "reviewer",
+                )
+            )).all()
+        )
+        projects = set(
+            (await db.scalars(
+                select(ResearchProject.id).where(ResearchProject.id.in_(list(project_ids)))
+            )).all()
+        )
+        existing = set(
+            (await db.execute(
+                select(ReviewAssignment.project_id, ReviewAssignment.reviewer_id).where(
+                    ReviewAssignment.project_id.in_(list(projects)),
+                    ReviewAssignment.reviewer_id.in_(list(reviewer_ids.values())),
+                )
+            )).all()
+        )
+
+        results, rows = [], []
+        for (project_id, email), index in wanted.items():
+            reviewer_id = reviewer_ids.get(email)
+            if reviewer_id is None:
+                results.append(error(index, "Reviewer not found or not a reviewer"))
+            elif project_id not in projects:
+                results.append(error(index, "Project not found"))
+            elif (project_id, reviewer_id) in existing:
+                results.append(error(index, "Reviewer already assigned"))
+            else:
+                results.append(ok(index))
+                rows.append({
+                    "project_id": project_id,
+                    "reviewer_id": reviewer_id,
+                    "assigned_by": editor_id,
+                })
+
+        if rows:
+            await db.execute(insert(ReviewAssignment), rows)
+        return results
+
+    return summarize(duplicates + await with_retries(db, attempt))
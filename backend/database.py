@@ -1,12 +1,191 @@
-from sqlalchemy import create_engine
+import os
+
+from sqlalchemy import create_engine, event
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.engine import make_url
 from sqlalchemy.orm import sessionmaker, declarative_base
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+from starlette.concurrency import run_in_threadpool
 
-DATABASE_URL = "sqlite:///./acadflow.db"
+DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./acadflow.db")
 
-engine = create_engine(
-    DATABASE_URL, connect_args={"check_same_thread": False}
-)
+# Async drivers for the sync URLs we know about; override with
+# ASYNC_DATABASE_URL for anything else
+ASYNC_DRIVERS = {
+    "sqlite": "sqlite+aiosqlite",
+    "postgresql": "postgresql+asyncpg",
+}
+
+# Upserts (review aggregates, imports) use INSERT ... ON CONFLICT, so only
+# backends that speak it are supported
+INSERT_DIALECTS = {"sqlite": sqlite, "postgresql": postgresql}
+
+# "async" serves requests through the async driver, "sync" through the
+# blocking SessionLocal offloaded to the threadpool (kept for load comparisons)
+DB_MODE = os.getenv("ACADFLOW_DB_MODE", "async")
+
+# Pool sizing, shared by the sync and async engines
+POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "10"))
+MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "20"))
+POOL_TIMEOUT = int(os.getenv("DB_POOL_TIMEOUT", "30"))
+POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+
+# Per-connection SQLite tuning
+SQLITE_PRAGMAS = {
+    "journal_mode": os.getenv("SQLITE_JOURNAL_MODE", "WAL"),
+    "synchronous": os.getenv("SQLITE_SYNCHRONOUS", "NORMAL"),
+    "busy_timeout": int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000")),
+    # negative cache_size is in KiB
+    "cache_size": -int(os.getenv("SQLITE_CACHE_SIZE_KB", "65536")),
+    "mmap_size": int(os.getenv("SQLITE_MMAP_SIZE", str(256 * 1024 * 1024))),
+    "temp_store": os.getenv("SQLITE_TEMP_STORE", "MEMORY"),
+}
+
+
+def to_async_url(url: str) -> str:
+    parsed = make_url(url)
+    if "+" in parsed.drivername:
+        return url
+
+    driver = ASYNC_DRIVERS.get(parsed.drivername)
+    if driver is None:
+        raise RuntimeError(
+            f"No async driver known for {parsed.drivername}, set ASYNC_DATABASE_URL"
+        )
+    return parsed.set(drivername=driver).render_as_string(hide_password=False)
+
+
+def check_backend(url: str) -> str:
+    backend = make_url(url).get_backend_name()
+    if backend not in INSERT_DIALECTS:
+        raise RuntimeError(
+            f"Unsupported database backend {backend}, use SQLite or PostgreSQL"
+        )
+    return backend
+
+
+BACKEND = check_backend(DATABASE_URL)
+ASYNC_DATABASE_URL = os.getenv("ASYNC_DATABASE_URL") or to_async_url(DATABASE_URL)
+
+
+def is_sqlite(url: str) -> bool:
+    return make_url(url).get_backend_name() == "sqlite"
+
+
+def dialect_insert(table):
+    # INSERT with the ON CONFLICT clauses of the configured backend
+    return INSERT_DIALECTS[BACKEND].insert(table)
+
+
+def apply_sqlite_pragmas(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    for name, value in SQLITE_PRAGMAS.items():
+        cursor.execute(f"PRAGMA {name}={value}")
+    cursor.close()
+
+
+def engine_options(url: str) -> dict:
+    options = {"pool_pre_ping": not is_sqlite(url)}
+
+    if is_sqlite(url):
+        options["connect_args"] = {"check_same_thread": False}
+        if make_url(url).database in (None, "", ":memory:"):
+            # An in-memory database only exists on its own connection
+            return options
+
+    options.update(
+        pool_size=POOL_SIZE,
+        max_overflow=MAX_OVERFLOW,
+        pool_timeout=POOL_TIMEOUT,
+        pool_recycle=POOL_RECYCLE,
+    )
+    return options
+
+
+def make_engine(url: str = DATABASE_URL):
+    new_engine = create_engine(url, **engine_options(url))
+    if is_sqlite(url):
+        event.listen(new_engine, "connect", apply_sqlite_pragmas)
+    return new_engine
+
+
+def make_async_engine(url: str = ASYNC_DATABASE_URL):
+    async_url = to_async_url(url)
+    new_engine = create_async_engine(async_url, **engine_options(async_url))
+    if is_sqlite(async_url):
+        event.listen(new_engine.sync_engine, "connect", apply_sqlite_pragmas)
+    return new_engine
+
+
+engine = make_engine()
 
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+async_engine = make_async_engine()
+
+AsyncSessionLocal = async_sessionmaker(
+    async_engine, autoflush=False, expire_on_commit=False
+)
+
 Base = declarative_base()
+
+
+class SyncSessionAdapter:
+    """Exposes a blocking Session through the AsyncSession calls used by
+    the route handlers, running each one in the threadpool."""
+
+    def __init__(self, session):
+        self.session = session
+
+    def add(self, instance):
+        self.session.add(instance)
+
+    def add_all(self, instances):
+        self.session.add_all(instances)
+
+    async def execute(self, statement, *args, **kwargs):
+        return await run_in_threadpool(self.session.execute, statement, *args, **kwargs)
+
+    async def scalar(self, statement, *args, **kwargs):
+        return await run_in_threadpool(self.session.scalar, statement, *args, **kwargs)
+
+    async def scalars(self, statement, *args, **kwargs):
+        return await run_in_threadpool(self.session.scalars, statement, *args, **kwargs)
+
+    async def get(self, entity, ident, **kwargs):
+        return await run_in_threadpool(self.session.get, entity, ident, **kwargs)
+
+    async def flush(self):
+        await run_in_threadpool(self.session.flush)
+
+    async def commit(self):
+        await run_in_threadpool(self.session.commit)
+
+    async def rollback(self):
+        await run_in_threadpool(self.session.rollback)
+
+    async def refresh(self, instance, *args, **kwargs):
+        await run_in_threadpool(self.session.refresh, instance, *args, **kwargs)
+
+    async def delete(self, instance):
+        await run_in_threadpool(self.session.delete, instance)
+
+    async def close(self):
+        await run_in_threadpool(self.session.close)
+
+
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
+
+
+async def get_sync_db():
+    db = SyncSessionAdapter(SessionLocal(expire_on_commit=False))
+    try:
+        yield db
+    finally:
+        await db.close()
+
+
+# Dependency used by every route handler
+get_db = get_sync_db if DB_MODE == "sync" else get_async_db
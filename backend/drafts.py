@@ -0,0 +1,385 @@
+import difflib
+import hashlib
+import json
+import os
+import sys
+import zlib
+
+from sqlalchemy import case, func, select, update
+
+from models import PaperDraft, ResearchProject, User
+from schemas import DraftResponse, DraftSummary
+
+# Every Nth version (and any version whose delta is not smaller than a
+# full copy) is stored as a compressed snapshot; the rest are deltas
+# against the previous stored version, so rebuilding one version never
+# replays more than SNAPSHOT_INTERVAL rows
+SNAPSHOT_INTERVAL = int(os.getenv("DRAFT_SNAPSHOT_INTERVAL", "20"))
+COMPRESSION_LEVEL = 6
+
+SNAPSHOT = "snapshot"
+DELTA = "delta"
+
+
+# ----------------------------------------
+# Encoding
+# ----------------------------------------
+def pack_snapshot(content: str) -> bytes:
+    return zlib.compress(content.encode("utf-8"), COMPRESSION_LEVEL)
+
+
+def make_delta(old: str, new: str) -> bytes:
+    old_lines = old.splitlines(keepends=True)
+    new_lines = new.splitlines(keepends=True)
+
+    # [start, end] copies lines from the base version, a string inserts text
+    ops = []
+    matcher = difflib.SequenceMatcher(None, old_lines, new_lines)
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        if tag == "equal":
+            ops.append([i1, i2])
+        elif j2 > j1:
+            ops.append("".join(new_lines[j1:j2]))
+
+    packed = json.dumps(ops, separators=(",", ":")).encode("utf-8")
+    return zlib.compress(packed, COMPRESSION_LEVEL)
+
+
+def apply_delta(old: str, payload: bytes) -> str:
+    old_lines = old.splitlines(keepends=True)
+    ops = json.loads(zlib.decompress(payload))
+    return "".join(
+        "".join(old_lines[op[0]:op[1]]) if isinstance(op, list) else op
+        for op in ops
+    )
+
+
+def content_metadata(content: str) -> dict:
+    data = content.encode("utf-8")
+    return {
+        "content_size": len(data),
+        "content_hash": hashlib.sha256(data).hexdigest(),
+    }
+
+
+def encode_version(version: int, content: str, previous=None) -> dict:
+    """Column values for a new version.
+
+    previous is (version, content, snapshot_version) of the latest stored
+    version of the project, or None for the first one.
+    """
+    snapshot = {
+        "content": "",
+        "storage": SNAPSHOT,
+        "base_version": None,
+        "payload": pack_snapshot(content),
+        **content_metadata(content),
+    }
+
+    if previous is None:
+        return snapshot
+
+    prev_version, prev_content, snapshot_version = previous
+    if version - snapshot_version >= SNAPSHOT_INTERVAL:
+        return snapshot
+
+    delta = make_delta(prev_content, content)
+    if len(delta) >= len(snapshot["payload"]):
+        return snapshot
+
+    return {
+        **snapshot,
+        "storage": DELTA,
+        "base_version": prev_version,
+        "payload": delta,
+    }
+
+
+# ----------------------------------------
+# Decoding
+# ----------------------------------------
+def materialize(rows, known=None) -> dict:
+    """Rebuild the text of rows (ordered by version) into {version: content}.
+
+    A delta's base must be in known or earlier in rows.
+    """
+    contents = dict(known or {})
+    for row in rows:
+        if row.storage == SNAPSHOT:
+            contents[row.version] = zlib.decompress(row.payload).decode("utf-8")
+        elif row.storage == DELTA:
+            contents[row.version] = apply_delta(
+                contents[row.base_version], row.payload
+            )
+        else:
+            # Rows written before delta storage keep their text inline
+            contents[row.version] = row.content
+    return contents
+
+
+def stored_size(row) -> int:
+    if row.storage in (SNAPSHOT, DELTA):
+        return len(row.payload)
+    return len(row.content.encode("utf-8"))
+
+
+def draft_response(row, content: str) -> DraftResponse:
+    return DraftResponse(
+        id=row.id,
+        project_id=row.project_id,
+        version=row.version,
+        content=content,
+        created_by=row.created_by,
+        created_at=row.created_at,
+    )
+
+
+# ----------------------------------------
+# Loading
+# ----------------------------------------
+def chain_start(project_id: int, version: int):
+    # Nearest self-contained row at or below the requested version
+    return (
+        select(func.max(PaperDraft.version))
+        .where(
+            PaperDraft.project_id == project_id,
+            PaperDraft.version <= version,
+            PaperDraft.storage.is_distinct_from(DELTA),
+        )
+        .scalar_subquery()
+    )
+
+
+def chain_statement(project_id: int, version: int):
+    return (
+        select(PaperDraft)
+        .where(
+            PaperDraft.project_id == project_id,
+            PaperDraft.version >= chain_start(project_id, version),
+            PaperDraft.version <= version,
+        )
+        .order_by(PaperDraft.version)
+    )
+
+
+async def load_version(db, project_id: int, version: int):
+    """Returns (row, content) for one version, or None."""
+    rows = (await db.scalars(chain_statement(project_id, version))).all()
+    if not rows or rows[-1].version != version:
+        return None
+    return rows[-1], materialize(rows)[version]
+
+
+async def load_page(db, project_id: int, after_version: int = 0, limit: int | None = None):
+    """Returns (rows, contents) for the versions after after_version."""
+    page = (
+        select(PaperDraft.version)
+        .where(
+            PaperDraft.project_id == project_id,
+            PaperDraft.version > after_version,
+        )
+        .order_by(PaperDraft.version)
+        .limit(limit)
+    )
+    versions = (await db.scalars(page)).all()
+    if not versions:
+        return [], {}
+
+    # Replay from the snapshot the first version of the page depends on
+    chain = (
+        select(PaperDraft)
+        .where(
+            PaperDraft.project_id == project_id,
+            PaperDraft.version >= chain_start(project_id, versions[0]),
+            PaperDraft.version <= versions[-1],
+        )
+        .order_by(PaperDraft.version)
+    )
+    rows = (await db.scalars(chain)).all()
+
+    wanted = set(versions)
+    return [row for row in rows if row.version in wanted], materialize(rows)
+
+
+def unhashed_content():
+    # Inline rows that predate the metadata columns are hashed on the fly
+    return case(
+        (
+            PaperDraft.content_hash.is_(None) & PaperDraft.storage.is_(None),
+            PaperDraft.content,
+        )
+    )
+
+
+def summary_statement(project_id: int, after_version: int = 0, limit: int | None = None):
+    inline = unhashed_content()
+    return (
+        select(
+            PaperDraft.id,
+            PaperDraft.version,
+            PaperDraft.created_by,
+            User.name,
+            PaperDraft.created_at,
+            PaperDraft.content_size,
+            PaperDraft.content_hash,
+            inline,
+        )
+        .join(User, User.id == PaperDraft.created_by)
+        .where(
+            PaperDraft.project_id == project_id,
+            PaperDraft.version > after_version,
+        )
+        .order_by(PaperDraft.version)
+        .limit(limit)
+    )
+
+
+def draft_summary(row) -> DraftSummary:
+    id, version, created_by, author_name, created_at, size, content_hash, inline = row
+    if content_hash is None and inline is not None:
+        metadata = content_metadata(inline)
+        size, content_hash = metadata["content_size"], metadata["content_hash"]
+
+    return DraftSummary(
+        id=id,
+        version=version,
+        created_by=created_by,
+        author_name=author_name,
+        created_at=created_at,
+        size=size,
+        content_hash=content_hash,
+    )
+
+
+def content_etag(content_hash: str | None, content: str | None) -> str:
+    if content_hash is None:
+        content_hash = content_metadata(content or "")["content_hash"]
+    return f'"{content_hash}"'
+
+
+async def version_etag(db, project_id: int, version: int) -> str | None:
+    """ETag of one version without decoding its delta chain, or None."""
+    row = (
+        await db.execute(
+            select(PaperDraft.content_hash, unhashed_content()).where(
+                PaperDraft.project_id == project_id, PaperDraft.version == version
+            )
+        )
+    ).first()
+    return None if row is None else content_etag(*row)
+
+
+async def load_previous(db, project_id: int, version: int):
+    """(version, content, snapshot_version) of the newest version below
+    version, or None."""
+    rows = (await db.scalars(chain_statement(project_id, version - 1))).all()
+    if not rows:
+        return None
+    return rows[-1].version, materialize(rows)[rows[-1].version], rows[0].version
+
+
+# ----------------------------------------
+# Version allocation
+# ----------------------------------------
+async def allocate_version(db, project_id: int) -> int:
+    # The UPDATE takes the write lock on the project row, so concurrent
+    # saves to the same project are serialized until this transaction ends
+    return await db.scalar(
+        update(ResearchProject)
+        .where(ResearchProject.id == project_id)
+        .values(last_draft_version=ResearchProject.last_draft_version + 1)
+        .returning(ResearchProject.last_draft_version)
+    )
+
+
+def max_version(project_id):
+    return (
+        select(func.coalesce(func.max(PaperDraft.version), 0))
+        .where(PaperDraft.project_id == project_id)
+        .scalar_subquery()
+    )
+
+
+async def resync_counter(db, project_id: int):
+    await db.execute(
+        update(ResearchProject)
+        .where(ResearchProject.id == project_id)
+        .values(last_draft_version=max_version(project_id))
+    )
+    await db.commit()
+
+
+# ----------------------------------------
+# Migrating existing rows
+# ----------------------------------------
+def compact_project(session, project_id: int):
+    """Re-encode every inline version of a project; returns (before, after) bytes."""
+    rows = session.scalars(
+        select(PaperDraft)
+        .where(PaperDraft.project_id == project_id)
+        .order_by(PaperDraft.version)
+    ).all()
+
+    contents = materialize(rows)
+    before = sum(stored_size(row) for row in rows)
+
+    previous = None
+    for row in rows:
+        content = contents[row.version]
+        if row.storage is None:
+            for key, value in encode_version(row.version, content, previous).items():
+                setattr(row, key, value)
+        elif row.content_hash is None:
+            for key, value in content_metadata(content).items():
+                setattr(row, key, value)
+
+        snapshot_version = (
+            previous[2] if row.storage == DELTA and previous else row.version
+        )
+        previous = (row.version, content, snapshot_version)
+
+    after = sum(stored_size(row) for row in rows)
+    return before, after
+
+
+def migrate(session, dry_run: bool = False):
+    project_ids = session.scalars(
+        select(PaperDraft.project_id)
+        .where(
+            (PaperDraft.storage.is_(None)) | (PaperDraft.content_hash.is_(None))
+        )
+        .distinct()
+    ).all()
+
+    total_before = total_after = 0
+    for project_id in project_ids:
+        before, after = compact_project(session, project_id)
+        total_before += before
+        total_after += after
+
+    if dry_run:
+        session.rollback()
+    else:
+        session.commit()
+
+    return len(project_ids), total_before, total_after
+
+
+if __name__ == "__main__":
+    from database import SessionLocal, engine
+    import models
+    import migrations
+
+    models.Base.metadata.create_all(bind=engine)
+    migrations.run_migrations(engine)
+
+    dry_run = "--dry-run" in sys.argv[1:]
+    with SessionLocal() as session:
+        projects, before, after = migrate(session, dry_run=dry_run)
+
+    saved = before - after
+    percent = (saved / before * 100) if before else 0.0
+    print(
+        f"{'Would compact' if dry_run else 'Compacted'} drafts of {projects} projects: "
+        f"{before} -> {after} bytes ({saved} saved, {percent:.1f}%)"
+    )
@@ -0,0 +1,135 @@
+import asyncio
+import json
+import logging
+import os
+from contextlib import asynccontextmanager
+
+from sqlalchemy import select
+
+from database import AsyncSessionLocal
+from models import PlagiarismJob
+
+logger = logging.getLogger("acadflow.events")
+
+# How often the hub re-reads watched jobs, to pick up transitions made by
+# `python worker.py` processes that cannot notify this one directly
+HUB_POLL_SECONDS = float(os.getenv("JOB_HUB_POLL_SECONDS", "1"))
+SSE_KEEPALIVE_SECONDS = 15
+LONG_POLL_MAX_SECONDS = 60
+
+TERMINAL_STATUSES = ("completed", "failed")
+
+
+def job_payload(job_id, status, completed_at) -> dict:
+    return {
+        "job_id": job_id,
+        "status": status,
+        "completed_at": completed_at.isoformat() if completed_at else None,
+    }
+
+
+def sse_message(payload: dict) -> str:
+    return f"event: status\ndata: {json.dumps(payload)}\n\n"
+
+
+class JobHub:
+    """Fans job status changes out to the SSE and long-poll clients of this
+    process.
+
+    In-process transitions call notify(); everything else is caught by one
+    shared poller that reads all watched jobs in a single query, so waiting
+    clients cost nothing per client.
+    """
+
+    def __init__(self, poll_seconds: float = HUB_POLL_SECONDS):
+        self.poll_seconds = poll_seconds
+        self._watchers: dict[int, set[asyncio.Queue]] = {}
+        self._last: dict[int, dict] = {}
+        self._loop = None
+        self._poller = None
+
+    def notify(self, job_id: int):
+        """Re-read a job now; safe to call from any thread."""
+        loop = self._loop
+        if loop is None or job_id not in self._watchers:
+            return
+        asyncio.run_coroutine_threadsafe(self._refresh([job_id]), loop)
+
+    @asynccontextmanager
+    async def watch(self, job_id: int, current: dict):
+        self._loop = asyncio.get_running_loop()
+        queue = asyncio.Queue()
+
+        self._watchers.setdefault(job_id, set()).add(queue)
+        self._last.setdefault(job_id, current)
+        if self._poller is None or self._poller.done():
+            self._poller = asyncio.create_task(self._poll())
+
+        try:
+            yield queue
+        finally:
+            watchers = self._watchers.get(job_id)
+            if watchers is not None:
+                watchers.discard(queue)
+                if not watchers:
+                    del self._watchers[job_id]
+                    self._last.pop(job_id, None)
+
+    def _deliver(self, payload: dict):
+        job_id = payload["job_id"]
+        if self._last.get(job_id) == payload:
+            return
+        self._last[job_id] = payload
+        for queue in self._watchers.get(job_id, ()):
+            queue.put_nowait(payload)
+
+    async def _refresh(self, job_ids):
+        async with AsyncSessionLocal() as db:
+            rows = (
+                await db.execute(
+                    select(
+                        PlagiarismJob.id,
+                        PlagiarismJob.status,
+                        PlagiarismJob.completed_at,
+                    ).where(PlagiarismJob.id.in_(job_ids))
+                )
+            ).all()
+        for row in rows:
+            self._deliver(job_payload(*row))
+
+    async def _poll(self):
+        while self._watchers:
+            await asyncio.sleep(self.poll_seconds)
+            if not self._watchers:
+                break
+            try:
+                await self._refresh(list(self._watchers))
+            except Exception:
+                logger.exception("Job status poll failed")
+
+
+hub = JobHub()
+
+
+async def stream_job(job_id: int, current: dict):
+    """Server-Sent Events until the job reaches a terminal status."""
+    async with hub.watch(job_id, current) as queue:
+        payload = current
+        yield sse_message(payload)
+
+        while payload["status"] not in TERMINAL_STATUSES:
+            try:
+                payload = await asyncio.wait_for(queue.get(), SSE_KEEPALIVE_SECONDS)
+            except asyncio.TimeoutError:
+                yield ": keepalive\n\n"
+                continue
+            yield sse_message(payload)
+
+
+async def wait_for_change(job_id: int, current: dict, timeout: float) -> dict:
+    """Long-poll: the next status of a job, or current after timeout."""
+    async with hub.watch(job_id, current) as queue:
+        try:
+            return await asyncio.wait_for(queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return current
@@ -1,13 +1,33 @@
-from fastapi import FastAPI, Depends, HTTPException
-from sqlalchemy.orm import Session
-from datetime import timedelta
+from fastapi import BackgroundTasks, FastAPI, Depends, HTTPException, Query, Request, Response
+from fastapi.responses import StreamingResponse
+from starlette.concurrency import run_in_threadpool
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import joinedload
+from datetime import datetime, timedelta
 from models import PaperDraft
-from schemas import DraftCreate, DraftResponse
-from sqlalchemy import func
+from schemas import DraftCreate, DraftResponse, DraftSummary
+from sqlalchemy import and_, func, or_, select, update
+from sqlalchemy.exc import IntegrityError
 from schemas import UserResponse
-from database import engine, SessionLocal
+from database import async_engine, engine, get_db
 import models
+import archive
+import bulk
+import drafts
+import events
+import metrics
+import migrations
+import plagiarism
+import response_cache
+import reviewers
+import scores
+import search
+import serialization
+import slow_queries
+import storage
+import worker
 from schemas import InviteMember, RespondInvite, ProjectMemberResponse
+from schemas import BulkAssignReviewers, BulkInviteMembers, BulkResult, BulkRoleChange
 from models import (
     User,
     ResearchProject,
@@ -15,25 +35,42 @@ from models import (
     PlagiarismJob,
 )
 from fastapi.middleware.cors import CORSMiddleware
-from schemas import UserCreate, UserLogin, ProjectCreate, ProjectResponse
+from schemas import UserCreate, UserLogin, ProjectCreate, ProjectResponse, ProjectSearchResult
 from auth import (
-    hash_password,
-    verify_password,
+    hash_password_async,
+    verify_and_update_password_async,
     create_access_token,
-    get_current_user,
+    get_current_principal,
+    invalidate_principal,
+    get_project_access,
+    get_project_acl,
+    resolve_project_access,
+    invalidate_project,
+    invalidate_all_projects,
+    Principal,
+    ProjectAccess,
 )
 from models import Review
-from schemas import ReviewCreate, ReviewResponse
+from schemas import ReviewCreate, ReviewResponse, ReviewSummary, LeaderboardEntry
 from models import ReviewAssignment
-from schemas import AssignReviewer, AssignmentResponse
+from schemas import PlagiarismJobResponse, SlowQueryReport
+from schemas import AssignReviewer, AssignmentResponse, AutoAssignReviewers, AutoAssignResult
 from fastapi import UploadFile, File
 import os
-import uuid
+
+DRAFT_SAVE_ATTEMPTS = 3
+
+# Submissions are checked by `python worker.py`, which must be running.
+# Set to "1" to also check them here, on the request threadpool (for
+# development: the analysis is CPU-bound). Inline failures are retried in
+# place; jobs left behind by a crashed API process still need the worker.
+PLAGIARISM_INLINE_JOBS = os.getenv("PLAGIARISM_INLINE_JOBS", "0") == "1"
 
 # ----------------------------------------
 # Create database tables
 # ----------------------------------------
 models.Base.metadata.create_all(bind=engine)
+migrations.run_migrations(engine)
 
 # ----------------------------------------
 # Create FastAPI app
@@ -49,38 +86,47 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Reject oversized uploads before the body is spooled
+app.add_middleware(storage.UploadLimitMiddleware)
 
+# Outermost, so rejected and failed requests are measured too
+app.add_middleware(metrics.MetricsMiddleware)
+metrics.instrument_engine(engine)
+metrics.instrument_engine(async_engine.sync_engine)
+slow_queries.instrument_engine(engine)
+slow_queries.instrument_engine(async_engine.sync_engine)
 
 
-# ----------------------------------------
-# Database dependency
-# ----------------------------------------
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
 
 
 # ----------------------------------------
 # Root
 # ----------------------------------------
 @app.get("/")
-def root():
+async def root():
     return {"message": "AcadFlow backend running 🚀"}
 
 
+# ----------------------------------------
+# Metrics (Prometheus text format)
+# ----------------------------------------
+@app.get("/metrics", include_in_schema=False)
+async def get_metrics(request: Request):
+    if metrics.METRICS_TOKEN and request.headers.get("authorization") != f"Bearer {metrics.METRICS_TOKEN}":
+        raise HTTPException(status_code=401, detail="Invalid metrics token")
+    return Response(metrics.render(), media_type=metrics.CONTENT_TYPE)
+
+
 # ----------------------------------------
 # Signup
 # ----------------------------------------
 @app.post("/signup")
-def signup(user: UserCreate, db: Session = Depends(get_db)):
-    existing_user = db.query(User).filter(User.email == user.email).first()
+async def signup(user: UserCreate, db: AsyncSession = Depends(get_db)):
+    existing_user = await db.scalar(select(User).where(User.email == user.email))
     if existing_user:
         raise HTTPException(status_code=400, detail="Email already registered")
 
-    hashed_pw = hash_password(user.password)
+    hashed_pw = await hash_password_async(user.password)
 
     new_user = User(
         name=user.name,
@@ -89,8 +135,8 @@ def signup(user: UserCreate, db: Session = Depends(get_db)):
     )
 
     db.add(new_user)
-    db.commit()
-    db.refresh(new_user)
+    await db.commit()
+    await db.refresh(new_user)
 
     return {"message": "User created successfully"}
 
@@ -99,14 +145,23 @@ def signup(user: UserCreate, db: Session = Depends(get_db)):
 # Login
 # ----------------------------------------
 @app.post("/login")
-def login(user: UserLogin, db: Session = Depends(get_db)):
-    db_user = db.query(User).filter(User.email == user.email).first()
+async def login(user: UserLogin, db: AsyncSession = Depends(get_db)):
+    db_user = await db.scalar(select(User).where(User.email == user.email))
+
+    if not db_user:
+        raise HTTPException(status_code=400, detail="Invalid email or password")
 
-    if not db_user or not verify_password(
+    valid, new_hash = await verify_and_update_password_async(
         user.password, db_user.hashed_password
-    ):
+    )
+    if not valid:
         raise HTTPException(status_code=400, detail="Invalid email or password")
 
+    # Rehash with the current bcrypt cost
+    if new_hash:
+        db_user.hashed_password = new_hash
+        await db.commit()
+
     access_token = create_access_token(
         data={"sub": db_user.email},
         expires_delta=timedelta(minutes=60),
@@ -124,64 +179,71 @@ def login(user: UserLogin, db: Session = Depends(get_db)):
 
 
 @app.get("/me", response_model=UserResponse)
-def read_current_user(
-    current_user_email: str = Depends(get_current_user),
-    db: Session = Depends(get_db),
+async def read_current_user(
+    user: Principal = Depends(get_current_principal),
 ):
-    user = db.query(User).filter(User.email == current_user_email).first()
-
-    if not user:
-        raise HTTPException(status_code=404, detail="User not found")
-
     return user
 
 @app.put("/users/{user_id}/role")
-def update_user_role(
+async def update_user_role(
     user_id: int,
     role: str,
-    current_user_email: str = Depends(get_current_user),
-    db: Session = Depends(get_db),
+    current_user: Principal = Depends(get_current_principal),
+    db: AsyncSession = Depends(get_db),
 ):
     if role not in ["student", "reviewer", "faculty"]:
         raise HTTPException(status_code=400, detail="Invalid role")
 
-    current_user = db.query(User).filter(
-        User.email == current_user_email
-    ).first()
-
     if current_user.role != "faculty":
         raise HTTPException(
             status_code=403,
             detail="Only faculty can change roles",
         )
 
-    target_user = db.query(User).filter(User.id == user_id).first()
+    target_user = await db.scalar(select(User).where(User.id == user_id))
 
     if not target_user:
         raise HTTPException(status_code=404, detail="User not found")
 
     target_user.role = role
-    db.commit()
+    await db.commit()
+
+    invalidate_principal(target_user.email)
 
     return {
         "message": f"User role updated to {role}"
     }
 
 
+@app.put("/users/roles", response_model=BulkResult)
+async def update_user_roles(
+    data: BulkRoleChange,
+    current_user: Principal = Depends(get_current_principal),
+    db: AsyncSession = Depends(get_db),
+):
+    if current_user.role != "faculty":
+        raise HTTPException(
+            status_code=403,
+            detail="Only faculty can change roles",
+        )
+
+    result, changed = await bulk.change_roles(db, data.changes)
+
+    for email in changed:
+        invalidate_principal(email)
+
+    return result
+
+
 # ----------------------------------------
 # Create Research Project
 # ----------------------------------------
 @app.post("/projects", response_model=ProjectResponse)
-def create_project(
+async def create_project(
     project: ProjectCreate,
-    current_user_email: str = Depends(get_current_user),
-    db: Session = Depends(get_db),
+    user: Principal = Depends(get_current_principal),
+    db: AsyncSession = Depends(get_db),
 ):
-    user = db.query(User).filter(User.email == current_user_email).first()
-
-    if not user:
-        raise HTTPException(status_code=404, detail="User not found")
-
     new_project = ResearchProject(
     title=project.title,
     abstract=project.abstract,
@@ -192,8 +254,8 @@ def create_project(
 
 
     db.add(new_project)
-    db.commit()
-    db.refresh(new_project)
+    await db.commit()
+    await db.refresh(new_project)
 
     # ✅ Add owner as project member
     owner_member = ProjectMember(
@@ -204,7 +266,8 @@ def create_project(
     )
 
     db.add(owner_member)
-    db.commit()
+    await db.commit()
+    response_cache.bump(response_cache.public_projects_scope())
 
     return new_project
 
@@ -213,49 +276,38 @@ def create_project(
 # Get My Projects
 # ----------------------------------------
 @app.get("/projects", response_model=list[ProjectResponse])
-def get_my_projects(
-    current_user_email: str = Depends(get_current_user),
-    db: Session = Depends(get_db),
+async def get_my_projects(
+    user: Principal = Depends(get_current_principal),
+    db: AsyncSession = Depends(get_db),
 ):
-    user = db.query(User).filter(User.email == current_user_email).first()
-
-    if not user:
-        raise HTTPException(status_code=404, detail="User not found")
-
-    projects = (
-        db.query(ResearchProject)
-        .filter(ResearchProject.owner_id == user.id)
-        .all()
-    )
-
-    return projects
+    return (
+        await db.execute(
+            select(*serialization.columns(ResearchProject, ProjectResponse))
+            .where(ResearchProject.owner_id == user.id)
+        )
+    ).all()
 
 
 @app.post("/projects/invite")
-def invite_member(
+async def invite_member(
     invite: InviteMember,
-    current_user_email: str = Depends(get_current_user),
-    db: Session = Depends(get_db),
+    inviter: Principal = Depends(get_current_principal),
+    db: AsyncSession = Depends(get_db),
 ):
-    inviter = db.query(User).filter(User.email == current_user_email).first()
-    project = db.query(ResearchProject).filter(
-        ResearchProject.id == invite.project_id
-    ).first()
-    invitee = db.query(User).filter(User.email == invite.email).first()
-
-    if not project:
-        raise HTTPException(status_code=404, detail="Project not found")
+    access = await resolve_project_access(db, invite.project_id, inviter)
 
-    if project.owner_id != inviter.id:
+    if access.permission != "owner":
         raise HTTPException(status_code=403, detail="Only owner can invite")
 
+    invitee = await db.scalar(select(User).where(User.email == invite.email))
+
     if not invitee:
         raise HTTPException(status_code=404, detail="User not found")
 
-    existing = db.query(ProjectMember).filter(
-        ProjectMember.project_id == project.id,
+    existing = await db.scalar(select(ProjectMember).where(
+        ProjectMember.project_id == access.project.project_id,
         ProjectMember.user_id == invitee.id,
-    ).first()
+    ))
 
     if existing:
         raise HTTPException(
@@ -264,215 +316,345 @@ def invite_member(
         )
 
     invitation = ProjectMember(
-        project_id=project.id,
+        project_id=access.project.project_id,
         user_id=invitee.id,
         role="co-author",
         is_accepted=False,
     )
 
     db.add(invitation)
-    db.commit()
+    try:
+        await db.commit()
+    except IntegrityError:
+        # A concurrent invite for the same user won the unique index
+        await db.rollback()
+        raise HTTPException(
+            status_code=400,
+            detail="User already invited or member",
+        )
 
+    invalidate_project(access.project.project_id)
     return {"message": "Invitation sent"}
+
+
+@app.post("/projects/invite/bulk", response_model=BulkResult)
+async def invite_members(
+    data: BulkInviteMembers,
+    inviter: Principal = Depends(get_current_principal),
+    db: AsyncSession = Depends(get_db),
+):
+    access = await resolve_project_access(db, data.project_id, inviter)
+
+    if access.permission != "owner":
+        raise HTTPException(status_code=403, detail="Only owner can invite")
+
+    result = await bulk.invite_members(db, data.project_id, data.emails)
+    invalidate_project(data.project_id)
+    return result
+
 @app.post("/projects/respond")
-def respond_to_invite(
+async def respond_to_invite(
     response: RespondInvite,
-    current_user_email: str = Depends(get_current_user),
-    db: Session = Depends(get_db),
+    user: Principal = Depends(get_current_principal),
+    db: AsyncSession = Depends(get_db),
 ):
-    user = db.query(User).filter(User.email == current_user_email).first()
-
-    membership = db.query(ProjectMember).filter(
+    membership = await db.scalar(select(ProjectMember).where(
         ProjectMember.project_id == response.project_id,
         ProjectMember.user_id == user.id,
-    ).first()
+    ))
 
     if not membership:
         raise HTTPException(status_code=404, detail="Invitation not found")
 
     if response.accept:
         membership.is_accepted = True
-        db.commit()
+        await db.commit()
+        invalidate_project(response.project_id)
+        response_cache.bump(response_cache.project_scope(response.project_id, "members"))
         return {"message": "Invitation accepted"}
     else:
-        db.delete(membership)
-        db.commit()
+        # Also how an accepted member leaves the project
+        await db.delete(membership)
+        await db.commit()
+        invalidate_project(response.project_id)
+        response_cache.bump(response_cache.project_scope(response.project_id, "members"))
         return {"message": "Invitation rejected"}
 @app.get("/projects/{project_id}/members", response_model=list[ProjectMemberResponse])
-def get_project_members(
+async def get_project_members(
     project_id: int,
-    current_user_email: str = Depends(get_current_user),
-    db: Session = Depends(get_db),
+    request: Request,
+    access: ProjectAccess = Depends(get_project_access),
+    db: AsyncSession = Depends(get_db),
 ):
-    user = db.query(User).filter(User.email == current_user_email).first()
-    project = db.query(ResearchProject).filter(
-        ResearchProject.id == project_id
-    ).first()
-
-    if not project:
-        raise HTTPException(status_code=404, detail="Project not found")
-
     # Only members can view members list
-    membership = db.query(ProjectMember).filter(
-        ProjectMember.project_id == project.id,
-        ProjectMember.user_id == user.id,
-        ProjectMember.is_accepted == True,
-    ).first()
-
-    if not membership:
+    if not access.is_member:
         raise HTTPException(status_code=403, detail="Access denied")
 
-    members = (
-        db.query(ProjectMember)
-        .join(User)
-        .filter(
-            ProjectMember.project_id == project.id,
-            ProjectMember.is_accepted == True,
-        )
-        .all()
+    async def build():
+        members = (
+            await db.scalars(
+                select(ProjectMember)
+                .join(User)
+                .options(joinedload(ProjectMember.user))
+                .where(
+                    ProjectMember.project_id == project_id,
+                    ProjectMember.is_accepted == True,
+                )
+            )
+        ).all()
+
+        return [
+            ProjectMemberResponse(
+                id=m.user.id,
+                name=m.user.name,
+                email=m.user.email,
+                role=m.role,
+            )
+            for m in members
+        ]
+
+    return await response_cache.cached_json(
+        request,
+        None,
+        response_cache.project_scope(project_id, "members"),
+        build,
+        list[ProjectMemberResponse],
     )
 
-    return [
-        ProjectMemberResponse(
-            id=m.user.id,
-            name=m.user.name,
-            email=m.user.email,
-            role=m.role,
-        )
-        for m in members
-    ]
-
 @app.put("/projects/{project_id}/visibility")
-def update_project_visibility(
+async def update_project_visibility(
     project_id: int,
     visibility: str,
-    current_user_email: str = Depends(get_current_user),
-    db: Session = Depends(get_db),
+    access: ProjectAccess = Depends(get_project_access),
+    db: AsyncSession = Depends(get_db),
 ):
     if visibility not in ["public", "private"]:
         raise HTTPException(status_code=400, detail="Invalid visibility")
 
-    user = db.query(User).filter(User.email == current_user_email).first()
-    project = db.query(ResearchProject).filter(
-        ResearchProject.id == project_id
-    ).first()
-
-    if not project:
-        raise HTTPException(status_code=404, detail="Project not found")
-
-    if project.owner_id != user.id:
+    if access.permission != "owner":
         raise HTTPException(status_code=403, detail="Only owner can change visibility")
 
-    project.visibility = visibility
-    db.commit()
+    await db.execute(
+        update(ResearchProject)
+        .where(ResearchProject.id == project_id)
+        .values(visibility=visibility)
+    )
+    await db.commit()
+    invalidate_project(project_id)
+    response_cache.bump(response_cache.public_projects_scope())
 
     return {"message": f"Project set to {visibility}"}
 
 @app.get("/projects/public", response_model=list[ProjectResponse])
-def get_public_projects(db: Session = Depends(get_db)):
-    projects = db.query(ResearchProject).filter(
-        ResearchProject.visibility == "public"
-    ).all()
+async def get_public_projects(request: Request, db: AsyncSession = Depends(get_db)):
+    async def build():
+        return (await db.execute(
+            select(*serialization.columns(ResearchProject, ProjectResponse))
+            .where(ResearchProject.visibility == "public")
+        )).all()
+
+    return await response_cache.cached_json(
+        request,
+        None,
+        response_cache.public_projects_scope(),
+        build,
+        list[ProjectResponse],
+        cache_control=response_cache.PUBLIC_REVALIDATE,
+    )
 
-    return projects
+
+# Ranked search over public projects; pass the X-Next-Cursor header of one
+# page as ?offset= to get the next one
+@app.get("/projects/search", response_model=list[ProjectSearchResult])
+async def search_projects(
+    response: Response,
+    q: str = Query(..., min_length=1, max_length=200),
+    domain: list[str] | None = Query(None),
+    limit: int = Query(20, ge=1, le=50),
+    offset: int = Query(0, ge=0, le=1000),
+    db: AsyncSession = Depends(get_db),
+):
+    results = await search.search_public_projects(db, q, domain, limit, offset)
+
+    if len(results) == limit:
+        response.headers["X-Next-Cursor"] = str(offset + limit)
+
+    return results
 
 @app.post("/drafts", response_model=DraftResponse)
-def create_draft(
+async def create_draft(
     draft: DraftCreate,
-    current_user_email: str = Depends(get_current_user),
-    db: Session = Depends(get_db),
+    background_tasks: BackgroundTasks,
+    user: Principal = Depends(get_current_principal),
+    db: AsyncSession = Depends(get_db),
 ):
-    user = db.query(User).filter(User.email == current_user_email).first()
+    # Check project and membership
+    access = await resolve_project_access(db, draft.project_id, user)
+    if not access.is_member:
+        raise HTTPException(status_code=403, detail="Not a project member")
 
-    # Check project
-    project = db.query(ResearchProject).filter(
-        ResearchProject.id == draft.project_id
-    ).first()
-    if not project:
-        raise HTTPException(status_code=404, detail="Project not found")
+    project_id = access.project.project_id
 
-    # Check membership
-    member = db.query(ProjectMember).filter(
-        ProjectMember.project_id == project.id,
-        ProjectMember.user_id == user.id,
-        ProjectMember.is_accepted == True,
-    ).first()
-    if not member:
-        raise HTTPException(status_code=403, detail="Not a project member")
+    for attempt in range(DRAFT_SAVE_ATTEMPTS):
+        # Get next version number, stored as a delta against the latest one
+        next_version = await drafts.allocate_version(db, project_id)
+        previous = await drafts.load_previous(db, project_id, next_version)
 
-    # Get next version number
-    last_version = db.query(func.max(PaperDraft.version)).filter(
-        PaperDraft.project_id == project.id
-    ).scalar()
+        new_draft = PaperDraft(
+            project_id=project_id,
+            created_by=user.id,
+            version=next_version,
+            **drafts.encode_version(next_version, draft.content, previous),
+        )
 
-    next_version = 1 if last_version is None else last_version + 1
+        db.add(new_draft)
+        try:
+            await db.commit()
+        except IntegrityError:
+            # The counter fell behind rows written some other way
+            await db.rollback()
+            await drafts.resync_counter(db, project_id)
+            continue
 
-    new_draft = PaperDraft(
-        project_id=project.id,
-        created_by=user.id,
-        version=next_version,
-        content=draft.content,
-    )
+        await db.refresh(new_draft)
+        response_cache.bump(response_cache.project_scope(project_id, "drafts"))
 
-    db.add(new_draft)
-    db.commit()
-    db.refresh(new_draft)
+        # Keep the similarity index on the latest version
+        background_tasks.add_task(plagiarism.index_project_drafts, project_id)
 
-    return new_draft
+        return drafts.draft_response(new_draft, draft.content)
+
+    raise HTTPException(
+        status_code=409,
+        detail="Could not save the draft, please retry",
+    )
+
+# Draft listings are paginated by version: pass the X-Next-Cursor header
+# of one page as ?after_version= to get the next one
 @app.get("/projects/{project_id}/drafts", response_model=list[DraftResponse])
-def get_project_drafts(
+async def get_project_drafts(
     project_id: int,
-    current_user_email: str = Depends(get_current_user),
-    db: Session = Depends(get_db),
+    request: Request,
+    after_version: int = 0,
+    limit: int | None = Query(None, ge=1, le=200),
+    access: ProjectAccess = Depends(get_project_access),
+    db: AsyncSession = Depends(get_db),
 ):
-    user = db.query(User).filter(User.email == current_user_email).first()
-
     # Check membership
-    member = db.query(ProjectMember).filter(
-        ProjectMember.project_id == project_id,
-        ProjectMember.user_id == user.id,
-        ProjectMember.is_accepted == True,
-    ).first()
-    if not member:
+    if not access.is_member:
         raise HTTPException(status_code=403, detail="Access denied")
 
-    drafts = (
-        db.query(PaperDraft)
-        .filter(PaperDraft.project_id == project_id)
-        .order_by(PaperDraft.version)
-        .all()
+    async def build():
+        rows, contents = await drafts.load_page(db, project_id, after_version, limit)
+        return [drafts.draft_response(row, contents[row.version]) for row in rows]
+
+    def cursor(page):
+        if limit is not None and len(page) == limit:
+            return {"X-Next-Cursor": str(page[-1].version)}
+        return {}
+
+    return await response_cache.cached_json(
+        request,
+        (after_version, limit),
+        response_cache.project_scope(project_id, "drafts"),
+        build,
+        list[DraftResponse],
+        headers=cursor,
     )
 
-    return drafts
+
+@app.get("/projects/{project_id}/drafts/summary", response_model=list[DraftSummary])
+async def get_project_draft_summaries(
+    project_id: int,
+    request: Request,
+    after_version: int = 0,
+    limit: int = Query(50, ge=1, le=500),
+    access: ProjectAccess = Depends(get_project_access),
+    db: AsyncSession = Depends(get_db),
+):
+    if not access.is_member:
+        raise HTTPException(status_code=403, detail="Access denied")
+
+    async def build():
+        rows = (
+            await db.execute(drafts.summary_statement(project_id, after_version, limit))
+        ).all()
+        return [drafts.draft_summary(row) for row in rows]
+
+    def cursor(page):
+        if len(page) == limit:
+            return {"X-Next-Cursor": str(page[-1].version)}
+        return {}
+
+    return await response_cache.cached_json(
+        request,
+        ("summary", after_version, limit),
+        response_cache.project_scope(project_id, "drafts"),
+        build,
+        list[DraftSummary],
+        headers=cursor,
+    )
+
+
+@app.get("/projects/{project_id}/drafts/{version}", response_model=DraftResponse)
+async def get_project_draft(
+    project_id: int,
+    version: int,
+    request: Request,
+    response: Response,
+    access: ProjectAccess = Depends(get_project_access),
+    db: AsyncSession = Depends(get_db),
+):
+    if not access.is_member:
+        raise HTTPException(status_code=403, detail="Access denied")
+
+    # The URL names ids, which can be reused or renumbered, so clients
+    # revalidate against the content hash; that check reads one column
+    # instead of decoding the delta chain
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        etag = await drafts.version_etag(db, project_id, version)
+        if etag is None:
+            raise HTTPException(status_code=404, detail="Draft not found")
+        if storage.etag_matches(if_none_match, etag):
+            return Response(
+                status_code=304,
+                headers={"etag": etag, "cache-control": storage.REVALIDATE_CACHE_CONTROL},
+            )
+
+    loaded = await drafts.load_version(db, project_id, version)
+    if loaded is None:
+        raise HTTPException(status_code=404, detail="Draft not found")
+
+    row, content = loaded
+    response.headers["etag"] = drafts.content_etag(row.content_hash, content)
+    response.headers["cache-control"] = storage.REVALIDATE_CACHE_CONTROL
+    return drafts.draft_response(row, content)
+
 @app.post("/reviews", response_model=ReviewResponse)
-def submit_review(
+async def submit_review(
     review: ReviewCreate,
-    current_user_email: str = Depends(get_current_user),
-    db: Session = Depends(get_db),
+    reviewer: Principal = Depends(get_current_principal),
+    db: AsyncSession = Depends(get_db),
 ):
-    reviewer = db.query(User).filter(User.email == current_user_email).first()
-
     if reviewer.role not in ["reviewer", "faculty"]:
         raise HTTPException(
             status_code=403,
             detail="Only reviewers or faculty can submit reviews",
         )
 
-    project = db.query(ResearchProject).filter(
-        ResearchProject.id == review.project_id,
-        ResearchProject.visibility == "public",
-    ).first()
+    project = await get_project_acl(db, review.project_id)
 
-    if not project:
+    if not project or project.visibility != "public":
         raise HTTPException(
             status_code=404,
             detail="Project not found or not open for review",
         )
 
-    existing = db.query(Review).filter(
-        Review.project_id == project.id,
+    existing = await db.scalar(select(Review).where(
+        Review.project_id == project.project_id,
         Review.reviewer_id == reviewer.id,
-    ).first()
+    ))
 
     if existing:
         raise HTTPException(
@@ -481,50 +663,100 @@ def submit_review(
         )
 
     new_review = Review(
-        project_id=project.id,
+        project_id=project.project_id,
         reviewer_id=reviewer.id,
         score=review.score,
         comments=review.comments,
     )
 
     db.add(new_review)
-    db.commit()
-    db.refresh(new_review)
+    try:
+        await db.execute(scores.record_review_statement(project.project_id, review.score))
+        await db.commit()
+    except IntegrityError:
+        await db.rollback()
+        raise HTTPException(
+            status_code=400,
+            detail="You have already reviewed this project",
+        )
+    await db.refresh(new_review)
+    response_cache.bump(response_cache.project_scope(project.project_id, "reviews"))
 
     return new_review
 
-@app.get("/projects/{project_id}/reviews", response_model=list[ReviewResponse])
-def get_project_reviews(
+@app.get("/projects/{project_id}/reviews/summary", response_model=ReviewSummary)
+async def get_project_review_summary(
     project_id: int,
-    current_user_email: str = Depends(get_current_user),
-    db: Session = Depends(get_db),
+    access: ProjectAccess = Depends(get_project_access),
+    db: AsyncSession = Depends(get_db),
 ):
-    user = db.query(User).filter(User.email == current_user_email).first()
+    # Same audience as the reviews themselves
+    if access.permission != "owner" and access.user.role != "faculty":
+        raise HTTPException(status_code=403, detail="Access denied")
 
-    # Must be project owner or faculty
-    project = db.query(ResearchProject).filter(
-        ResearchProject.id == project_id
-    ).first()
+    return await scores.project_summary(db, project_id)
 
-    if not project:
-        raise HTTPException(status_code=404, detail="Project not found")
 
-    if project.owner_id != user.id and user.role != "faculty":
-        raise HTTPException(status_code=403, detail="Access denied")
+# Public projects ranked by mean review score; pass the X-Next-Cursor
+# header of one page as ?cursor= to get the next one
+@app.get("/reviews/leaderboard", response_model=list[LeaderboardEntry])
+async def get_review_leaderboard(
+    response: Response,
+    domain: str | None = None,
+    min_reviews: int = Query(1, ge=1),
+    cursor: str | None = None,
+    limit: int = Query(50, ge=1, le=200),
+    user: Principal = Depends(get_current_principal),
+    db: AsyncSession = Depends(get_db),
+):
+    if user.role != "faculty":
+        raise HTTPException(status_code=403, detail="Faculty access only")
 
-    reviews = db.query(Review).filter(
-        Review.project_id == project.id
-    ).all()
+    position = None
+    if cursor is not None:
+        try:
+            position = scores.parse_leaderboard_cursor(cursor)
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+
+    entries = await scores.leaderboard(db, limit, position, domain, min_reviews)
 
-    return reviews
+    if len(entries) == limit:
+        response.headers["X-Next-Cursor"] = scores.leaderboard_cursor(entries[-1])
+
+    return entries
+
+
+@app.get("/projects/{project_id}/reviews", response_model=list[ReviewResponse])
+async def get_project_reviews(
+    project_id: int,
+    request: Request,
+    access: ProjectAccess = Depends(get_project_access),
+    db: AsyncSession = Depends(get_db),
+):
+    # Must be project owner or faculty
+    if access.permission != "owner" and access.user.role != "faculty":
+        raise HTTPException(status_code=403, detail="Access denied")
+
+    async def build():
+        return (await db.execute(
+            select(*serialization.columns(Review, ReviewResponse))
+            .where(Review.project_id == project_id)
+        )).all()
+
+    return await response_cache.cached_json(
+        request,
+        None,
+        response_cache.project_scope(project_id, "reviews"),
+        build,
+        list[ReviewResponse],
+    )
 @app.post("/assign-reviewer", response_model=AssignmentResponse)
-def assign_reviewer(
+async def assign_reviewer(
     data: AssignReviewer,
-    current_user_email: str = Depends(get_current_user),
-    db: Session = Depends(get_db),
+    editor: Principal = Depends(get_current_principal),
+    db: AsyncSession = Depends(get_db),
 ):
-    editor = db.query(User).filter(User.email == current_user_email).first()
-
     # Only faculty can assign reviewers
     if editor.role != "faculty":
         raise HTTPException(
@@ -532,9 +764,9 @@ def assign_reviewer(
             detail="Only faculty can assign reviewers",
         )
 
-    reviewer = db.query(User).filter(
+    reviewer = await db.scalar(select(User).where(
         User.email == data.reviewer_email
-    ).first()
+    ))
 
     if not reviewer or reviewer.role != "reviewer":
         raise HTTPException(
@@ -542,9 +774,7 @@ def assign_reviewer(
             detail="Reviewer not found or not a reviewer",
         )
 
-    project = db.query(ResearchProject).filter(
-        ResearchProject.id == data.project_id
-    ).first()
+    project = await get_project_acl(db, data.project_id)
 
     if not project:
         raise HTTPException(
@@ -552,10 +782,10 @@ def assign_reviewer(
             detail="Project not found",
         )
 
-    existing = db.query(ReviewAssignment).filter(
-        ReviewAssignment.project_id == project.id,
+    existing = await db.scalar(select(ReviewAssignment).where(
+        ReviewAssignment.project_id == project.project_id,
         ReviewAssignment.reviewer_id == reviewer.id,
-    ).first()
+    ))
 
     if existing:
         raise HTTPException(
@@ -564,28 +794,80 @@ def assign_reviewer(
         )
 
     assignment = ReviewAssignment(
-        project_id=project.id,
+        project_id=project.project_id,
         reviewer_id=reviewer.id,
         assigned_by=editor.id,
     )
 
     db.add(assignment)
-    db.commit()
-    db.refresh(assignment)
+    try:
+        await db.commit()
+    except IntegrityError:
+        await db.rollback()
+        raise HTTPException(
+            status_code=400,
+            detail="Reviewer already assigned",
+        )
+    await db.refresh(assignment)
 
     return assignment
+
+
+@app.post("/assign-reviewers/bulk", response_model=BulkResult)
+async def assign_reviewers(
+    data: BulkAssignReviewers,
+    editor: Principal = Depends(get_current_principal),
+    db: AsyncSession = Depends(get_db),
+):
+    if editor.role != "faculty":
+        raise HTTPException(
+            status_code=403,
+            detail="Only faculty can assign reviewers",
+        )
+
+    return await bulk.assign_reviewers(db, editor.id, data.assignments)
+
+
+@app.post("/assign-reviewers/auto", response_model=AutoAssignResult)
+async def auto_assign_reviewers(
+    data: AutoAssignReviewers,
+    editor: Principal = Depends(get_current_principal),
+    db: AsyncSession = Depends(get_db),
+):
+    """Staff projects with reviewers in one pass: domain matches first,
+    least-loaded first, never a member of the project. dry_run returns the
+    plan without saving it."""
+    if editor.role != "faculty":
+        raise HTTPException(
+            status_code=403,
+            detail="Only faculty can assign reviewers",
+        )
+
+    try:
+        return await reviewers.auto_assign(
+            db,
+            editor.id,
+            data.project_ids,
+            data.reviewers_per_project,
+            data.max_load,
+            data.dry_run,
+        )
+    except IntegrityError:
+        await db.rollback()
+        raise HTTPException(
+            status_code=409,
+            detail="Assignments changed while planning, please retry",
+        )
+
 @app.post("/plagiarism/upload")
-def upload_for_plagiarism(
+async def upload_for_plagiarism(
     project_id: int,
+    background_tasks: BackgroundTasks,
     file: UploadFile = File(...),
-    current_user_email: str = Depends(get_current_user),
-    db: Session = Depends(get_db),
+    user: Principal = Depends(get_current_principal),
+    db: AsyncSession = Depends(get_db),
 ):
-    user = db.query(User).filter(User.email == current_user_email).first()
-
-    project = db.query(ResearchProject).filter(
-        ResearchProject.id == project_id
-    ).first()
+    project = await get_project_acl(db, project_id)
 
     if not project or project.owner_id != user.id:
         raise HTTPException(
@@ -601,123 +883,243 @@ def upload_for_plagiarism(
         )
 
     # Save file
-    os.makedirs("uploads/submissions", exist_ok=True)
-    unique_name = f"{uuid.uuid4()}_{file.filename}"
-    file_path = os.path.join("uploads/submissions", unique_name)
-
-    with open(file_path, "wb") as f:
-        f.write(file.file.read())
+    stored = await storage.store_upload(file, "submissions")
+
+    # Identical resubmission of a file already being checked
+    existing = await db.scalar(select(PlagiarismJob).where(
+        PlagiarismJob.project_id == project.project_id,
+        PlagiarismJob.content_hash == stored.sha256,
+        PlagiarismJob.status != "failed",
+    ))
+    if existing:
+        return {
+            "job_id": existing.id,
+            "status": existing.status,
+            "message": "Identical file already submitted",
+        }
 
     # Create plagiarism job
     job = PlagiarismJob(
         user_id=user.id,
-        project_id=project.id,
-        file_path=file_path,
+        project_id=project.project_id,
+        file_path=stored.path,
+        content_hash=stored.sha256,
         status="queued",
     )
 
     db.add(job)
-    db.commit()
-    db.refresh(job)
+    await db.commit()
+    await db.refresh(job)
+
+    if PLAGIARISM_INLINE_JOBS:
+        background_tasks.add_task(worker.process_job, job.id)
 
     return {
         "job_id": job.id,
         "status": job.status,
-        "eta": "6 hours",
+        "eta": "1 minute",
         "message": "File uploaded successfully",
     }
-@app.get("/admin/plagiarism/jobs")
-def list_plagiarism_jobs(
-    current_user_email: str = Depends(get_current_user),
-    db: Session = Depends(get_db),
-):
-    admin = db.query(User).filter(
-        User.email == current_user_email
-    ).first()
+def job_cursor(job) -> str:
+    return f"{job.created_at.isoformat()},{job.id}"
 
+
+def parse_job_cursor(cursor: str):
+    try:
+        created_at, job_id = cursor.rsplit(",", 1)
+        return datetime.fromisoformat(created_at), int(job_id)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+# Newest first, paginated on (created_at, id): pass the X-Next-Cursor
+# header of one page as ?cursor= to get the next one
+@app.get("/admin/plagiarism/jobs", response_model=list[PlagiarismJobResponse])
+async def list_plagiarism_jobs(
+    response: Response,
+    status: str | None = None,
+    project_id: int | None = None,
+    user_id: int | None = None,
+    created_after: datetime | None = None,
+    created_before: datetime | None = None,
+    cursor: str | None = None,
+    limit: int = Query(100, ge=1, le=500),
+    admin: Principal = Depends(get_current_principal),
+    db: AsyncSession = Depends(get_db),
+):
     if admin.role != "faculty":
         raise HTTPException(
             status_code=403,
             detail="Admin access only",
         )
 
-    jobs = db.query(PlagiarismJob).all()
+    query = select(*serialization.columns(PlagiarismJob, PlagiarismJobResponse))
+
+    if status is not None:
+        query = query.where(PlagiarismJob.status == status)
+    if project_id is not None:
+        query = query.where(PlagiarismJob.project_id == project_id)
+    if user_id is not None:
+        query = query.where(PlagiarismJob.user_id == user_id)
+    if created_after is not None:
+        query = query.where(PlagiarismJob.created_at >= created_after)
+    if created_before is not None:
+        query = query.where(PlagiarismJob.created_at < created_before)
+
+    if cursor is not None:
+        created_at, job_id = parse_job_cursor(cursor)
+        query = query.where(or_(
+            PlagiarismJob.created_at < created_at,
+            and_(PlagiarismJob.created_at == created_at, PlagiarismJob.id < job_id),
+        ))
+
+    jobs = (await db.execute(
+        query
+        .order_by(PlagiarismJob.created_at.desc(), PlagiarismJob.id.desc())
+        .limit(limit)
+    )).all()
+
+    if len(jobs) == limit:
+        response.headers["X-Next-Cursor"] = job_cursor(jobs[-1])
 
     return jobs
 
+
+@app.get("/admin/plagiarism/jobs/counts")
+async def count_plagiarism_jobs(
+    admin: Principal = Depends(get_current_principal),
+    db: AsyncSession = Depends(get_db),
+):
+    if admin.role != "faculty":
+        raise HTTPException(
+            status_code=403,
+            detail="Admin access only",
+        )
+
+    rows = (await db.execute(
+        select(PlagiarismJob.status, func.count())
+        .group_by(PlagiarismJob.status)
+    )).all()
+
+    counts = {status: 0 for status in ("queued", "processing", "completed", "failed")}
+    counts.update({status: count for status, count in rows})
+    counts["total"] = sum(count for _, count in rows)
+    return counts
+
+# Statements over SLOW_QUERY_MS seen by this process, worst first
+@app.get("/admin/slow-queries", response_model=SlowQueryReport)
+async def list_slow_queries(
+    sort: str = Query("total", pattern="^(total|count|max|mean)$"),
+    limit: int = Query(20, ge=1, le=500),
+    admin: Principal = Depends(get_current_principal),
+):
+    if admin.role != "faculty":
+        raise HTTPException(status_code=403, detail="Admin access only")
+
+    return SlowQueryReport(
+        enabled=slow_queries.SLOW_QUERY_MS is not None,
+        threshold_ms=slow_queries.SLOW_QUERY_MS,
+        queries=slow_queries.top(limit, sort),
+    )
+
+
+@app.delete("/admin/slow-queries")
+async def reset_slow_queries(admin: Principal = Depends(get_current_principal)):
+    if admin.role != "faculty":
+        raise HTTPException(status_code=403, detail="Admin access only")
+
+    slow_queries.reset()
+    return {"message": "Slow query log cleared"}
+
 @app.post("/admin/plagiarism/{job_id}/upload-report")
-def upload_plagiarism_report(
+async def upload_plagiarism_report(
     job_id: int,
     report: UploadFile = File(...),
-    current_user_email: str = Depends(get_current_user),
-    db: Session = Depends(get_db),
+    admin: Principal = Depends(get_current_principal),
+    db: AsyncSession = Depends(get_db),
 ):
-    admin = db.query(User).filter(
-        User.email == current_user_email
-    ).first()
-
     if admin.role != "faculty":
         raise HTTPException(status_code=403)
 
-    job = db.query(PlagiarismJob).filter(
+    job = await db.scalar(select(PlagiarismJob).where(
         PlagiarismJob.id == job_id
-    ).first()
+    ))
 
     if not job:
         raise HTTPException(status_code=404)
 
-    os.makedirs("uploads/reports", exist_ok=True)
-    report_path = f"uploads/reports/{uuid.uuid4()}_{report.filename}"
+    stored = await storage.store_upload(report, "reports")
 
-    with open(report_path, "wb") as f:
-        f.write(report.file.read())
-
-    job.report_path = report_path
+    job.report_path = stored.path
     job.status = "completed"
     job.completed_at = datetime.utcnow()
 
-    db.commit()
+    await db.commit()
+    events.hub.notify(job.id)
 
     return {"message": "Report uploaded successfully"}
 
+async def job_status(db, job_id: int, user_id: int) -> dict:
+    row = (await db.execute(
+        select(PlagiarismJob.id, PlagiarismJob.status, PlagiarismJob.completed_at)
+        .where(PlagiarismJob.id == job_id, PlagiarismJob.user_id == user_id)
+    )).first()
+
+    if not row:
+        raise HTTPException(status_code=404, detail="Job not found")
+
+    # Waiting clients must not hold a pooled connection
+    await db.close()
+    return events.job_payload(*row)
+
+
 @app.get("/plagiarism/{job_id}/status")
-def check_plagiarism_status(
+async def check_plagiarism_status(
     job_id: int,
-    current_user_email: str = Depends(get_current_user),
-    db: Session = Depends(get_db),
+    wait: float = Query(0, ge=0, le=events.LONG_POLL_MAX_SECONDS),
+    since: str | None = None,
+    user: Principal = Depends(get_current_principal),
+    db: AsyncSession = Depends(get_db),
 ):
-    user = db.query(User).filter(User.email == current_user_email).first()
+    """With wait, long-polls: answers as soon as the status differs from
+    since (default: the current status), or after wait seconds."""
+    payload = await job_status(db, job_id, user.id)
 
-    job = db.query(PlagiarismJob).filter(
-        PlagiarismJob.id == job_id,
-        PlagiarismJob.user_id == user.id,
-    ).first()
+    if wait and payload["status"] not in events.TERMINAL_STATUSES:
+        if since is None or since == payload["status"]:
+            payload = await events.wait_for_change(job_id, payload, wait)
 
-    if not job:
-        raise HTTPException(status_code=404, detail="Job not found")
+    return payload
 
-    return {
-        "job_id": job.id,
-        "status": job.status,
-        "completed_at": job.completed_at,
-    }
 
-from fastapi.responses import FileResponse
-import os
+@app.get("/plagiarism/{job_id}/events")
+async def stream_plagiarism_status(
+    job_id: int,
+    user: Principal = Depends(get_current_principal),
+    db: AsyncSession = Depends(get_db),
+):
+    """Server-Sent Events stream of status changes, closed once the job
+    completes or fails."""
+    payload = await job_status(db, job_id, user.id)
+
+    return StreamingResponse(
+        events.stream_job(job_id, payload),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
 
 @app.get("/plagiarism/{job_id}/report")
-def download_plagiarism_report(
+async def download_plagiarism_report(
     job_id: int,
-    current_user_email: str = Depends(get_current_user),
-    db: Session = Depends(get_db),
+    request: Request,
+    user: Principal = Depends(get_current_principal),
+    db: AsyncSession = Depends(get_db),
 ):
-    user = db.query(User).filter(User.email == current_user_email).first()
-
-    job = db.query(PlagiarismJob).filter(
+    job = await db.scalar(select(PlagiarismJob).where(
         PlagiarismJob.id == job_id,
         PlagiarismJob.user_id == user.id,
         PlagiarismJob.status == "completed",
-    ).first()
+    ))
 
     if not job or not job.report_path:
         raise HTTPException(
@@ -731,8 +1133,64 @@ def download_plagiarism_report(
             detail="Report file missing",
         )
 
-    return FileResponse(
+    # The file is content-addressed, but faculty can replace a job's
+    # report, so the URL is revalidated against the file's ETag
+    extension = os.path.splitext(job.report_path)[1]
+    return storage.serve_file(
+        request,
         job.report_path,
-        media_type="application/pdf",
-        filename=os.path.basename(job.report_path),
+        filename=f"plagiarism-report-{job.id}{extension}",
+        cache_control=storage.REVALIDATE_CACHE_CONTROL,
+    )
+
+
+# ----------------------------------------
+# Export / import (faculty only)
+# ----------------------------------------
+def require_archive_table(table: str):
+    if table not in archive.TABLES:
+        raise HTTPException(status_code=404, detail="Unknown table")
+
+
+@app.get("/admin/export/{table}")
+async def export_table(
+    table: str,
+    format: str = Query("ndjson", pattern="^(ndjson|csv)$"),
+    gzip: bool = False,
+    admin: Principal = Depends(get_current_principal),
+):
+    if admin.role != "faculty":
+        raise HTTPException(status_code=403, detail="Admin access only")
+    require_archive_table(table)
+
+    # The generator reads through its own server-side cursor and is
+    # iterated in the threadpool, one chunk at a time
+    filename = archive.export_filename(table, format, gzip)
+    return StreamingResponse(
+        archive.stream_export(table, format, gzip),
+        media_type="application/gzip" if gzip else archive.FORMATS[format],
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
     )
+
+
+@app.post("/admin/import/{table}")
+async def import_table(
+    table: str,
+    file: UploadFile = File(...),
+    format: str | None = Query(None, pattern="^(ndjson|csv)$"),
+    admin: Principal = Depends(get_current_principal),
+):
+    if admin.role != "faculty":
+        raise HTTPException(status_code=403, detail="Admin access only")
+    require_archive_table(table)
+
+    fmt = format or archive.file_format(file.filename or "")
+    try:
+        result = await run_in_threadpool(archive.import_upload, table, file.file, fmt)
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=str(exc))
+
+    # Imported rows can change any project's members, drafts or reviews
+    invalidate_all_projects()
+    response_cache.clear()
+    return result
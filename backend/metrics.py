@@ -0,0 +1,253 @@
+import bisect
+import os
+import threading
+import time
+from contextvars import ContextVar
+
+from sqlalchemy import event
+
+# Set to "0" to drop the per-request query headers
+METRICS_DEBUG_HEADERS = os.getenv("METRICS_DEBUG_HEADERS", "1") == "1"
+
+# When set, /metrics requires "Authorization: Bearer <token>"
+METRICS_TOKEN = os.getenv("METRICS_TOKEN")
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+# Requests that matched no route share one label, so scanners probing
+# random paths cannot grow the series without bound
+UNMATCHED = "unmatched"
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+# ----------------------------------------
+# Registry
+# ----------------------------------------
+class Histogram:
+    __slots__ = ("buckets", "counts", "total", "count")
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.total += value
+        self.count += 1
+
+    def copy(self) -> "Histogram":
+        copy = Histogram(self.buckets)
+        copy.counts = list(self.counts)
+        copy.total = self.total
+        copy.count = self.count
+        return copy
+
+
+class RouteStats:
+    __slots__ = ("latency", "queries", "statuses", "query_count", "query_seconds")
+
+    def __init__(self):
+        self.latency = Histogram(LATENCY_BUCKETS)
+        self.queries = Histogram(QUERY_COUNT_BUCKETS)
+        self.statuses: dict[int, int] = {}
+        self.query_count = 0
+        self.query_seconds = 0.0
+
+    def copy(self) -> "RouteStats":
+        copy = RouteStats()
+        copy.latency = self.latency.copy()
+        copy.queries = self.queries.copy()
+        copy.statuses = dict(self.statuses)
+        copy.query_count = self.query_count
+        copy.query_seconds = self.query_seconds
+        return copy
+
+
+_routes: dict[tuple[str, str], RouteStats] = {}
+_in_flight = 0
+_lock = threading.Lock()
+
+
+def record(method: str, route: str, status: int, seconds: float, query_count: int, query_seconds: float):
+    with _lock:
+        stats = _routes.get((method, route))
+        if stats is None:
+            stats = _routes[method, route] = RouteStats()
+        stats.latency.observe(seconds)
+        stats.queries.observe(query_count)
+        stats.statuses[status] = stats.statuses.get(status, 0) + 1
+        stats.query_count += query_count
+        stats.query_seconds += query_seconds
+
+
+def reset():
+    with _lock:
+        _routes.clear()
+
+
+# ----------------------------------------
+# SQL statements per request
+# ----------------------------------------
+class QueryStats:
+    __slots__ = ("count", "seconds", "scope")
+
+    def __init__(self, scope):
+        self.count = 0
+        self.seconds = 0.0
+        self.scope = scope
+
+
+# Set by the middleware for the duration of a request. Threadpool calls
+# (sync DB mode) run in a copy of the context, so they update the same
+# object; statements run outside a request are not counted.
+_current: ContextVar[QueryStats | None] = ContextVar("query_stats", default=None)
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if _current.get() is not None:
+        context._metrics_started = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    stats = _current.get()
+    started = getattr(context, "_metrics_started", None)
+    if stats is not None and started is not None:
+        stats.count += 1
+        stats.seconds += time.perf_counter() - started
+
+
+def current_route() -> str | None:
+    """Route of the request being served, as "GET /projects/{project_id}"."""
+    stats = _current.get()
+    if stats is None:
+        return None
+    route = getattr(stats.scope.get("route"), "path", None) or UNMATCHED
+    return f"{stats.scope['method']} {route}"
+
+
+def instrument_engine(engine):
+    """Count statements run on engine (sync, or an AsyncEngine's sync_engine)."""
+    event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+
+
+# ----------------------------------------
+# Middleware
+# ----------------------------------------
+class MetricsMiddleware:
+    """Times every HTTP request and counts the SQL statements it runs.
+
+    Responses carry X-Query-Count and X-Query-Time-Ms with the statements
+    run before the headers were sent (all of them, except for streamed
+    bodies).
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        global _in_flight
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        queries = QueryStats(scope)
+        token = _current.set(queries)
+        status = 500
+        started = time.perf_counter()
+        # (seconds, statements, statement time) when the body was complete;
+        # background tasks that run afterwards are not the client's wait
+        finished = None
+        with _lock:
+            _in_flight += 1
+
+        async def send_with_metrics(message):
+            nonlocal status, finished
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                if METRICS_DEBUG_HEADERS:
+                    message["headers"] = [
+                        *message.get("headers", []),
+                        (b"x-query-count", str(queries.count).encode()),
+                        (b"x-query-time-ms", f"{queries.seconds * 1000:.2f}".encode()),
+                    ]
+            elif message["type"] == "http.response.body" and not message.get("more_body"):
+                finished = (time.perf_counter() - started, queries.count, queries.seconds)
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_metrics)
+        finally:
+            _current.reset(token)
+            if finished is None:
+                finished = (time.perf_counter() - started, queries.count, queries.seconds)
+            with _lock:
+                _in_flight -= 1
+            # The router stores the matched route in the shared scope
+            route = getattr(scope.get("route"), "path", None) or UNMATCHED
+            record(scope["method"], route, status, *finished)
+
+
+# ----------------------------------------
+# Prometheus text format
+# ----------------------------------------
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(**labels) -> str:
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in labels.items()) + "}"
+
+
+def _histogram(lines, name: str, histogram: Histogram, **labels):
+    cumulative = 0
+    for bound, count in zip(histogram.buckets, histogram.counts):
+        cumulative += count
+        lines.append(f"{name}_bucket{_labels(**labels, le=bound)} {cumulative}")
+    lines.append(f"{name}_bucket{_labels(**labels, le='+Inf')} {histogram.count}")
+    lines.append(f"{name}_sum{_labels(**labels)} {histogram.total}")
+    lines.append(f"{name}_count{_labels(**labels)} {histogram.count}")
+
+
+def _family(lines, name: str, kind: str, help: str):
+    lines.append(f"# HELP {name} {help}")
+    lines.append(f"# TYPE {name} {kind}")
+
+
+def render() -> str:
+    # Snapshot under the lock, format outside it
+    with _lock:
+        in_flight = _in_flight
+        routes = [(method, route, stats.copy()) for (method, route), stats in sorted(_routes.items())]
+
+    lines = []
+    _family(lines, "acadflow_http_requests_in_flight", "gauge", "Requests being served.")
+    lines.append(f"acadflow_http_requests_in_flight {in_flight}")
+
+    _family(lines, "acadflow_http_requests_total", "counter", "Requests served, by route and status.")
+    for method, route, stats in routes:
+        for status, count in sorted(stats.statuses.items()):
+            labels = _labels(method=method, route=route, status=status)
+            lines.append(f"acadflow_http_requests_total{labels} {count}")
+
+    _family(lines, "acadflow_http_request_duration_seconds", "histogram", "Request latency, by route.")
+    for method, route, stats in routes:
+        _histogram(lines, "acadflow_http_request_duration_seconds", stats.latency, method=method, route=route)
+
+    _family(lines, "acadflow_db_queries_per_request", "histogram", "SQL statements per request, by route.")
+    for method, route, stats in routes:
+        _histogram(lines, "acadflow_db_queries_per_request", stats.queries, method=method, route=route)
+
+    _family(lines, "acadflow_db_queries_total", "counter", "SQL statements run by requests, by route.")
+    for method, route, stats in routes:
+        lines.append(f"acadflow_db_queries_total{_labels(method=method, route=route)} {stats.query_count}")
+
+    _family(lines, "acadflow_db_query_seconds_total", "counter", "Time spent in SQL statements, by route.")
+    for method, route, stats in routes:
+        lines.append(f"acadflow_db_query_seconds_total{_labels(method=method, route=route)} {stats.query_seconds}")
+
+    return "\n".join(lines) + "\n"
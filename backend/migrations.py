@@ -0,0 +1,225 @@
+import sys
+from datetime import datetime
+
+from sqlalchemy import Column, DateTime, Integer, MetaData, String, Table, inspect, text
+
+from database import Base
+import scores
+import search
+
+# Applied data migrations, one row per entry of MIGRATIONS
+schema_migrations = Table(
+    "schema_migrations",
+    MetaData(),
+    Column("version", Integer, primary_key=True),
+    Column("name", String, nullable=False),
+    Column("applied_at", DateTime, nullable=False),
+)
+
+
+# ----------------------------------------
+# Additive schema changes
+# ----------------------------------------
+# create_all only creates missing tables, so columns added to existing
+# models are brought in here with ALTER TABLE
+def add_missing_columns(engine, metadata=Base.metadata):
+    inspector = inspect(engine)
+
+    with engine.begin() as conn:
+        for table in metadata.sorted_tables:
+            if not inspector.has_table(table.name):
+                continue
+
+            existing = {column["name"] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in existing:
+                    continue
+
+                ddl = f"ALTER TABLE {table.name} ADD COLUMN {column.name} "
+                ddl += column.type.compile(engine.dialect)
+                if column.server_default is not None:
+                    ddl += f" DEFAULT {column.server_default.arg}"
+                conn.execute(text(ddl))
+
+
+def create_missing_indexes(engine, metadata=Base.metadata):
+    with engine.begin() as conn:
+        for table in metadata.sorted_tables:
+            for index in table.indexes:
+                index.create(bind=conn, checkfirst=True)
+
+
+# ----------------------------------------
+# Draft versions
+# ----------------------------------------
+def renumber_duplicate_versions(conn):
+    # Versions written concurrently before the unique index existed can
+    # collide; renumber those projects in (version, id) order
+    projects = conn.execute(text(
+        "SELECT DISTINCT project_id FROM paper_drafts "
+        "GROUP BY project_id, version HAVING COUNT(*) > 1"
+    )).scalars().all()
+
+    for project_id in projects:
+        rows = conn.execute(
+            text(
+                "SELECT id, version, base_version FROM paper_drafts "
+                "WHERE project_id = :project_id ORDER BY version, id"
+            ),
+            {"project_id": project_id},
+        ).all()
+
+        latest = {}
+        for new_version, (row_id, version, base_version) in enumerate(rows, start=1):
+            conn.execute(
+                text(
+                    "UPDATE paper_drafts SET version = :version, base_version = :base "
+                    "WHERE id = :id"
+                ),
+                {
+                    "version": new_version,
+                    "base": latest.get(base_version),
+                    "id": row_id,
+                },
+            )
+            latest[version] = new_version
+
+
+def upgrade_draft_versions(conn):
+    conn.execute(text("DROP INDEX IF EXISTS ix_paper_drafts_project_version"))
+    renumber_duplicate_versions(conn)
+
+    # Start each project's counter at its highest stored version
+    conn.execute(text(
+        "UPDATE research_projects SET last_draft_version = ("
+        "SELECT COALESCE(MAX(version), 0) FROM paper_drafts "
+        "WHERE paper_drafts.project_id = research_projects.id) "
+        "WHERE last_draft_version < ("
+        "SELECT COALESCE(MAX(version), 0) FROM paper_drafts "
+        "WHERE paper_drafts.project_id = research_projects.id)"
+    ))
+
+
+# ----------------------------------------
+# Memberships and reviews
+# ----------------------------------------
+def remove_duplicate_pairs(conn):
+    # Check-then-insert races could store the same pair twice; keep one row
+    # per pair so the unique indexes can be built
+    conn.execute(text(
+        "DELETE FROM project_members WHERE id NOT IN ("
+        "SELECT (SELECT m.id FROM project_members AS m "
+        "WHERE m.project_id = p.project_id AND m.user_id = p.user_id "
+        "ORDER BY m.is_accepted DESC, m.id LIMIT 1) "
+        "FROM project_members AS p GROUP BY p.project_id, p.user_id)"
+    ))
+    for table in ("reviews", "review_assignments"):
+        conn.execute(text(
+            f"DELETE FROM {table} WHERE id NOT IN ("
+            f"SELECT MIN(id) FROM {table} GROUP BY project_id, reviewer_id)"
+        ))
+
+
+# ----------------------------------------
+# Versioned data migrations
+# ----------------------------------------
+# Each step runs once per database, in its own transaction, after the
+# additive column changes and before the indexes are (re)created. Append
+# new steps; never renumber or edit applied ones.
+MIGRATIONS = [
+    (1, "draft version counters", upgrade_draft_versions),
+    (2, "unique membership and review pairs", remove_duplicate_pairs),
+    (3, "project full-text search", search.create_search_index),
+    (4, "review score aggregates", scores.rebuild_review_stats),
+]
+
+
+def applied_versions(engine) -> set:
+    schema_migrations.create(bind=engine, checkfirst=True)
+    with engine.connect() as conn:
+        return set(conn.execute(schema_migrations.select().with_only_columns(
+            schema_migrations.c.version
+        )).scalars())
+
+
+def apply_pending(engine):
+    applied = applied_versions(engine)
+    for version, name, step in MIGRATIONS:
+        if version in applied:
+            continue
+        with engine.begin() as conn:
+            step(conn)
+            conn.execute(schema_migrations.insert().values(
+                version=version, name=name, applied_at=datetime.utcnow()
+            ))
+
+
+def run_migrations(engine):
+    add_missing_columns(engine)
+    apply_pending(engine)
+    create_missing_indexes(engine)
+
+
+# ----------------------------------------
+# Query plans of the hot paths
+# ----------------------------------------
+# tests/test_query_plans.py asserts each of these scans before the
+# migrations and uses an index after them
+HOT_PATHS = {
+    "membership check": (
+        "SELECT * FROM project_members WHERE project_id = 1 "
+        "AND user_id = 1 AND is_accepted = 1"
+    ),
+    "project members": (
+        "SELECT * FROM project_members WHERE project_id = 1 AND is_accepted = 1"
+    ),
+    "existing review": (
+        "SELECT * FROM reviews WHERE project_id = 1 AND reviewer_id = 1"
+    ),
+    "project reviews": "SELECT * FROM reviews WHERE project_id = 1",
+    "existing assignment": (
+        "SELECT * FROM review_assignments WHERE project_id = 1 AND reviewer_id = 1"
+    ),
+    "owned projects": "SELECT * FROM research_projects WHERE owner_id = 1",
+    "public projects": "SELECT * FROM research_projects WHERE visibility = 'public'",
+}
+
+
+def explain_hot_paths(engine) -> dict:
+    """EXPLAIN QUERY PLAN detail of each hot-path query (SQLite only)."""
+    plans = {}
+    with engine.connect() as conn:
+        for name, sql in HOT_PATHS.items():
+            rows = conn.execute(text("EXPLAIN QUERY PLAN " + sql)).all()
+            plans[name] = "; ".join(row[-1] for row in rows)
+    return plans
+
+
+def uses_index(plan: str) -> bool:
+    return "USING INDEX" in plan or "USING COVERING INDEX" in plan
+
+
+if __name__ == "__main__":
+    # python migrations.py [--check]
+    # Migrates the configured database, printing the hot-path query plans
+    # before and after; --check exits non-zero if any of them still scans
+    from database import engine
+    import models
+
+    before = explain_hot_paths(engine) if inspect(engine).has_table("project_members") else {}
+    models.Base.metadata.create_all(bind=engine)
+    run_migrations(engine)
+    # Statements cached on pooled connections keep their old plans
+    engine.dispose()
+    after = explain_hot_paths(engine)
+
+    for name, plan in after.items():
+        print(f"{name}:")
+        print(f"  before: {before.get(name, '(no table)')}")
+        print(f"  after:  {plan}")
+
+    scans = [name for name, plan in after.items() if not uses_index(plan)]
+    if scans:
+        print("Full scans: " + ", ".join(scans))
+        if "--check" in sys.argv[1:]:
+            sys.exit(1)
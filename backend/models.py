@@ -1,7 +1,7 @@
 from sqlalchemy import Column, Integer, String, Text, ForeignKey, Boolean, DateTime
 from sqlalchemy.orm import relationship
 from datetime import datetime
-from sqlalchemy import Column, Integer, String, Text, ForeignKey, Boolean, DateTime
+from sqlalchemy import Column, Integer, String, Text, ForeignKey, Boolean, DateTime, LargeBinary, Index, Float
 from sqlalchemy.orm import relationship
 from datetime import datetime
 
@@ -31,12 +31,36 @@ class PlagiarismJob(Base):
     file_path = Column(String, nullable=False)
     report_path = Column(String, nullable=True)
 
+    # sha256 of the submission, used to dedupe identical resubmissions
+    content_hash = Column(String, nullable=True)
+
+    # highest similarity found by the detection engine, 0..1
+    similarity = Column(Float, nullable=True)
+
+    # worker bookkeeping, see worker.py
+    attempts = Column(Integer, nullable=False, default=0, server_default="0")
+    lease_owner = Column(String, nullable=True)
+    lease_expires_at = Column(DateTime, nullable=True)
+    next_attempt_at = Column(DateTime, nullable=True)
+    last_error = Column(Text, nullable=True)
+
     status = Column(String, default="queued")  
     # queued | processing | completed | failed
 
     created_at = Column(DateTime, default=datetime.utcnow)
     completed_at = Column(DateTime, nullable=True)
 
+    __table_args__ = (
+        Index("ix_plagiarism_jobs_project_hash", "project_id", "content_hash"),
+        # Admin listing filters, each ordered like the (created_at, id)
+        # keyset; the status one also serves the per-status counts and
+        # the worker's oldest-queued-job claim
+        Index("ix_plagiarism_jobs_created", "created_at", "id"),
+        Index("ix_plagiarism_jobs_status_created", "status", "created_at", "id"),
+        Index("ix_plagiarism_jobs_project_created", "project_id", "created_at", "id"),
+        Index("ix_plagiarism_jobs_user_created", "user_id", "created_at", "id"),
+    )
+
 class ResearchProject(Base):
     __tablename__ = "research_projects"
 
@@ -48,8 +72,16 @@ class ResearchProject(Base):
 
     owner_id = Column(Integer, ForeignKey("users.id"), nullable=False)
 
+    # highest draft version handed out, bumped atomically by create_draft
+    last_draft_version = Column(Integer, nullable=False, default=0, server_default="0")
+
     owner = relationship("User")
 
+    __table_args__ = (
+        Index("ix_research_projects_owner", "owner_id"),
+        Index("ix_research_projects_visibility", "visibility"),
+    )
+
 
 class ProjectMember(Base):
     __tablename__ = "project_members"
@@ -65,6 +97,12 @@ class ProjectMember(Base):
     user = relationship("User")
     project = relationship("ResearchProject")
 
+    # One membership per user and project; the access check on
+    # (project_id, user_id, is_accepted) is a single-row lookup on it
+    __table_args__ = (
+        Index("uq_project_members_project_user", "project_id", "user_id", unique=True),
+    )
+
 
 class PaperDraft(Base):
     __tablename__ = "paper_drafts"
@@ -75,13 +113,26 @@ class PaperDraft(Base):
     created_by = Column(Integer, ForeignKey("users.id"), nullable=False)
 
     version = Column(Integer, nullable=False)
-    content = Column(Text, nullable=False)
+    content = Column(Text, nullable=False)  # inline text of legacy rows, "" otherwise
+
+    storage = Column(String, nullable=True)
+    # NULL (inline content) | snapshot | delta, see drafts.py
+    base_version = Column(Integer, nullable=True)
+    payload = Column(LargeBinary, nullable=True)
+
+    # metadata for the version list, so it never touches the body
+    content_size = Column(Integer, nullable=True)
+    content_hash = Column(String, nullable=True)
 
     created_at = Column(DateTime, default=datetime.utcnow)
 
     project = relationship("ResearchProject")
     author = relationship("User")
 
+    __table_args__ = (
+        Index("uq_paper_drafts_project_version", "project_id", "version", unique=True),
+    )
+
 class Review(Base):
     __tablename__ = "reviews"
 
@@ -98,6 +149,31 @@ class Review(Base):
     project = relationship("ResearchProject")
     reviewer = relationship("User")
 
+    __table_args__ = (
+        Index("uq_reviews_project_reviewer", "project_id", "reviewer_id", unique=True),
+    )
+
+class ReviewStats(Base):
+    __tablename__ = "review_stats"
+
+    # Running aggregates of a project's reviews, updated by submit_review
+    # in the same transaction as the review itself
+    project_id = Column(Integer, ForeignKey("research_projects.id"), primary_key=True)
+
+    review_count = Column(Integer, nullable=False, default=0)
+    score_sum = Column(Integer, nullable=False, default=0)
+    score_sq_sum = Column(Integer, nullable=False, default=0)
+    score_min = Column(Integer, nullable=True)
+    score_max = Column(Integer, nullable=True)
+
+    # score_sum / review_count, stored so the leaderboard reads in index order
+    mean_score = Column(Float, nullable=True)
+
+    __table_args__ = (
+        Index("ix_review_stats_mean", "mean_score", "project_id"),
+    )
+
+
 class ReviewAssignment(Base):
     __tablename__ = "review_assignments"
 
@@ -112,3 +188,46 @@ class ReviewAssignment(Base):
     project = relationship("ResearchProject", foreign_keys=[project_id])
     reviewer = relationship("User", foreign_keys=[reviewer_id])
     editor = relationship("User", foreign_keys=[assigned_by])
+
+    __table_args__ = (
+        Index(
+            "uq_review_assignments_project_reviewer",
+            "project_id", "reviewer_id",
+            unique=True,
+        ),
+    )
+
+
+class SimilarityDocument(Base):
+    __tablename__ = "similarity_documents"
+
+    id = Column(Integer, primary_key=True, index=True)
+
+    # draft (latest version of a project) | submission (a PlagiarismJob)
+    source = Column(String, nullable=False)
+    source_id = Column(Integer, nullable=False)
+    project_id = Column(Integer, ForeignKey("research_projects.id"), nullable=False)
+
+    signature = Column(LargeBinary, nullable=False)  # MinHash, see plagiarism.py
+    shingle_count = Column(Integer, nullable=False)
+
+    indexed_at = Column(DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        Index("uq_similarity_documents_source", "source", "source_id", unique=True),
+    )
+
+
+class SimilarityBucket(Base):
+    __tablename__ = "similarity_buckets"
+
+    id = Column(Integer, primary_key=True)
+
+    document_id = Column(Integer, ForeignKey("similarity_documents.id"), nullable=False)
+    band = Column(Integer, nullable=False)
+    bucket = Column(Integer, nullable=False)
+
+    __table_args__ = (
+        Index("ix_similarity_buckets_band_bucket", "band", "bucket"),
+        Index("ix_similarity_buckets_document", "document_id"),
+    )
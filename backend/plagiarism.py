@@ -0,0 +1,438 @@
+import array
+import hashlib
+import html
+import json
+import logging
+import os
+import random
+import re
+import sys
+import zipfile
+import zlib
+from datetime import datetime
+
+from sqlalchemy import delete, func, insert, select, tuple_
+from sqlalchemy.exc import IntegrityError
+
+from database import SessionLocal
+from models import (
+    PlagiarismJob,
+    ResearchProject,
+    SimilarityBucket,
+    SimilarityDocument,
+)
+import drafts
+import storage
+
+try:
+    import numpy
+except ImportError:  # pure-Python MinHash below gives identical signatures
+    numpy = None
+
+try:
+    from pypdf import PdfReader
+except ImportError:
+    PdfReader = None
+
+logger = logging.getLogger("acadflow.plagiarism")
+
+SHINGLE_SIZE = int(os.getenv("PLAGIARISM_SHINGLE_SIZE", "5"))  # words
+MIN_SIMILARITY = float(os.getenv("PLAGIARISM_MIN_SIMILARITY", "0.05"))
+
+# 32 bands of 4 rows: pairs above ~0.4 Jaccard almost always share a bucket
+NUM_PERM = 128
+BANDS = 32
+ROWS = NUM_PERM // BANDS
+
+MAX_CANDIDATES = 50
+REPORT_MATCHES = 10
+PASSAGES_PER_MATCH = 5
+MIN_PASSAGE_SHINGLES = 3
+
+MERSENNE_PRIME = (1 << 61) - 1
+MAX_HASH = (1 << 32) - 1
+MASK64 = (1 << 64) - 1
+NUMPY_BLOCK = 8192
+
+# Fixed seed: stored signatures are only comparable under the same permutations
+_rng = random.Random(1)
+PERMUTATIONS = [
+    (_rng.randint(1, MERSENNE_PRIME - 1), _rng.randint(0, MERSENNE_PRIME - 1))
+    for _ in range(NUM_PERM)
+]
+
+DRAFT = "draft"
+SUBMISSION = "submission"
+
+
+# ----------------------------------------
+# Text extraction
+# ----------------------------------------
+PDF_STREAM = re.compile(rb"stream\r?\n(.*?)\r?\nendstream", re.S)
+PDF_SHOW_TEXT = re.compile(rb"\(((?:\\.|[^\\)])*)\)\s*Tj|\[((?:\\.|[^\]])*)\]\s*TJ", re.S)
+PDF_STRING = re.compile(rb"\(((?:\\.|[^\\)])*)\)", re.S)
+
+
+def docx_text(path: str) -> str:
+    with zipfile.ZipFile(path) as archive:
+        xml = archive.read("word/document.xml").decode("utf-8", "ignore")
+    xml = xml.replace("</w:p>", "\n")
+    return html.unescape(re.sub(r"<[^>]+>", "", xml))
+
+
+def pdf_text(path: str) -> str:
+    if PdfReader is not None:
+        try:
+            return "\n".join(page.extract_text() or "" for page in PdfReader(path).pages)
+        except Exception:
+            logger.warning("pypdf could not read %s, using fallback", path)
+
+    # Without pypdf: pull the text-showing operators out of the content streams
+    with open(path, "rb") as f:
+        data = f.read()
+
+    chunks = []
+    for stream in PDF_STREAM.findall(data):
+        try:
+            stream = zlib.decompress(stream)
+        except zlib.error:
+            pass
+        for literal, parts in PDF_SHOW_TEXT.findall(stream):
+            chunks.extend([literal] if literal else PDF_STRING.findall(parts))
+
+    return b" ".join(chunks).decode("latin-1")
+
+
+def extract_text(path: str) -> str:
+    if not storage.is_stored_path(path):
+        raise ValueError(f"Not a stored file: {path}")
+    extension = os.path.splitext(path)[1].lower()
+    if extension == ".docx":
+        return docx_text(path)
+    if extension == ".pdf":
+        return pdf_text(path)
+    with open(path, encoding="utf-8", errors="ignore") as f:
+        return f.read()
+
+
+# ----------------------------------------
+# Shingling and MinHash
+# ----------------------------------------
+WORD = re.compile(r"\w+")
+
+
+def tokenize(text: str) -> list[str]:
+    return WORD.findall(text)
+
+
+def shingle_hashes(words: list[str]) -> list[int]:
+    """32-bit hash of the shingle starting at each word position."""
+    lowered = [word.lower() for word in words]
+    count = max(len(lowered) - SHINGLE_SIZE + 1, 1 if lowered else 0)
+    return [
+        int.from_bytes(
+            hashlib.blake2b(
+                " ".join(lowered[i:i + SHINGLE_SIZE]).encode("utf-8"), digest_size=4
+            ).digest(),
+            "little",
+        )
+        for i in range(count)
+    ]
+
+
+def minhash(hashes) -> list[int]:
+    unique = list(set(hashes))
+    if not unique:
+        return [MAX_HASH] * NUM_PERM
+
+    if numpy is None:
+        return [
+            min(((a * h + b) & MASK64) % MERSENNE_PRIME & MAX_HASH for h in unique)
+            for a, b in PERMUTATIONS
+        ]
+
+    a = numpy.array([p[0] for p in PERMUTATIONS], dtype=numpy.uint64)[:, None]
+    b = numpy.array([p[1] for p in PERMUTATIONS], dtype=numpy.uint64)[:, None]
+    signature = numpy.full(NUM_PERM, MAX_HASH, dtype=numpy.uint64)
+    with numpy.errstate(over="ignore"):
+        for start in range(0, len(unique), NUMPY_BLOCK):
+            block = numpy.array(unique[start:start + NUMPY_BLOCK], dtype=numpy.uint64)
+            values = numpy.bitwise_and((a * block + b) % MERSENNE_PRIME, MAX_HASH)
+            signature = numpy.minimum(signature, values.min(axis=1))
+    return [int(value) for value in signature]
+
+
+def pack_signature(signature: list[int]) -> bytes:
+    return array.array("I", signature).tobytes()
+
+
+def unpack_signature(data: bytes) -> list[int]:
+    signature = array.array("I")
+    signature.frombytes(data)
+    return signature.tolist()
+
+
+def band_buckets(signature: list[int]):
+    for band in range(BANDS):
+        rows = array.array("I", signature[band * ROWS:(band + 1) * ROWS]).tobytes()
+        digest = hashlib.blake2b(rows, digest_size=8).digest()
+        yield band, int.from_bytes(digest, "little", signed=True)
+
+
+def estimate_similarity(left: list[int], right: list[int]) -> float:
+    return sum(1 for x, y in zip(left, right) if x == y) / NUM_PERM
+
+
+# ----------------------------------------
+# Index
+# ----------------------------------------
+def index_document(session, source: str, source_id: int, project_id: int, hashes):
+    """Insert or replace a document's signature and LSH buckets."""
+    signature = minhash(hashes)
+
+    document = session.scalar(select(SimilarityDocument).where(
+        SimilarityDocument.source == source,
+        SimilarityDocument.source_id == source_id,
+    ))
+    if document:
+        session.execute(
+            delete(SimilarityBucket).where(SimilarityBucket.document_id == document.id)
+        )
+        document.signature = pack_signature(signature)
+        document.shingle_count = len(hashes)
+        document.indexed_at = datetime.utcnow()
+    else:
+        document = SimilarityDocument(
+            source=source,
+            source_id=source_id,
+            project_id=project_id,
+            signature=pack_signature(signature),
+            shingle_count=len(hashes),
+        )
+        session.add(document)
+        session.flush()
+
+    session.execute(
+        insert(SimilarityBucket),
+        [
+            {"document_id": document.id, "band": band, "bucket": bucket}
+            for band, bucket in band_buckets(signature)
+        ],
+    )
+    return signature
+
+
+def find_similar(session, signature: list[int], exclude_project_id: int):
+    """Ranked (similarity, document) pairs sharing an LSH bucket."""
+    hits = (
+        select(SimilarityBucket.document_id)
+        .where(
+            tuple_(SimilarityBucket.band, SimilarityBucket.bucket).in_(
+                list(band_buckets(signature))
+            )
+        )
+        .group_by(SimilarityBucket.document_id)
+        .order_by(func.count().desc())
+        .limit(MAX_CANDIDATES)
+    )
+    documents = session.scalars(
+        select(SimilarityDocument).where(
+            SimilarityDocument.id.in_(hits),
+            SimilarityDocument.project_id != exclude_project_id,
+        )
+    ).all()
+
+    ranked = [
+        (estimate_similarity(signature, unpack_signature(document.signature)), document)
+        for document in documents
+    ]
+    ranked = [pair for pair in ranked if pair[0] >= MIN_SIMILARITY]
+    ranked.sort(key=lambda pair: pair[0], reverse=True)
+    return ranked[:REPORT_MATCHES]
+
+
+def latest_draft_text(session, project_id: int) -> str:
+    latest = session.scalar(
+        select(ResearchProject.last_draft_version).where(ResearchProject.id == project_id)
+    )
+    if not latest:
+        return ""
+
+    rows = session.scalars(drafts.chain_statement(project_id, latest)).all()
+    if not rows:
+        return ""
+    return drafts.materialize(rows)[rows[-1].version]
+
+
+def submission_available(job) -> bool:
+    return storage.is_stored_path(job.file_path) and os.path.exists(job.file_path)
+
+
+def document_text(session, document) -> str:
+    if document.source == DRAFT:
+        return latest_draft_text(session, document.project_id)
+
+    job = session.get(PlagiarismJob, document.source_id)
+    if job is None or not submission_available(job):
+        return ""
+    return extract_text(job.file_path)
+
+
+def index_project_drafts(project_id: int):
+    """Re-index the latest draft of a project; run after each save."""
+    with SessionLocal() as session:
+        for attempt in range(2):
+            hashes = shingle_hashes(tokenize(latest_draft_text(session, project_id)))
+            if not hashes:
+                return
+            try:
+                # The document row is flushed inside index_document, so a
+                # concurrent first index of the project fails there
+                index_document(session, DRAFT, project_id, project_id, hashes)
+                session.commit()
+                return
+            except IntegrityError:
+                # Another save indexed the project at the same moment; the
+                # retry finds its row and replaces the signature
+                session.rollback()
+                if attempt:
+                    raise
+
+
+# ----------------------------------------
+# Matching passages
+# ----------------------------------------
+def matching_passages(words, hashes, other_words, other_hashes):
+    first_position = {}
+    for position, value in enumerate(other_hashes):
+        first_position.setdefault(value, position)
+
+    runs = []
+    i = 0
+    while i < len(hashes):
+        j = first_position.get(hashes[i])
+        if j is None:
+            i += 1
+            continue
+
+        start_i, start_j = i, j
+        while (
+            i + 1 < len(hashes)
+            and j + 1 < len(other_hashes)
+            and hashes[i + 1] == other_hashes[j + 1]
+        ):
+            i += 1
+            j += 1
+
+        length = i - start_i + 1
+        if length >= MIN_PASSAGE_SHINGLES:
+            runs.append((length, start_i, start_j))
+        i += 1
+
+    runs.sort(reverse=True)
+    passages = []
+    for length, start_i, start_j in runs[:PASSAGES_PER_MATCH]:
+        size = length + SHINGLE_SIZE - 1
+        passages.append({
+            "words": size,
+            "submitted": " ".join(words[start_i:start_i + size]),
+            "matched": " ".join(other_words[start_j:start_j + size]),
+        })
+    return passages
+
+
+# ----------------------------------------
+# Jobs
+# ----------------------------------------
+def analyze_job(session, job) -> dict:
+    """Match a submission against the index, then add it to the index."""
+    words = tokenize(extract_text(job.file_path))
+    hashes = shingle_hashes(words)
+    signature = minhash(hashes)
+
+    matches = []
+    for similarity, document in find_similar(session, signature, job.project_id):
+        other_words = tokenize(document_text(session, document))
+        title = session.scalar(
+            select(ResearchProject.title).where(ResearchProject.id == document.project_id)
+        )
+        matches.append({
+            "source": document.source,
+            "source_id": document.source_id,
+            "project_id": document.project_id,
+            "project_title": title,
+            "similarity": round(similarity, 3),
+            "passages": matching_passages(
+                words, hashes, other_words, shingle_hashes(other_words)
+            ),
+        })
+
+    if hashes:
+        index_document(session, SUBMISSION, job.id, job.project_id, hashes)
+
+    return {
+        "job_id": job.id,
+        "project_id": job.project_id,
+        "generated_at": datetime.utcnow().isoformat(),
+        "words": len(words),
+        "similarity": matches[0]["similarity"] if matches else 0.0,
+        "matches": matches,
+    }
+
+
+def complete_job(session, job, report: dict):
+    stored = storage.store_bytes(
+        json.dumps(report, indent=2).encode("utf-8"), "reports", ".json"
+    )
+    job.report_path = stored.path
+    job.similarity = report["similarity"]
+    job.status = "completed"
+    job.completed_at = datetime.utcnow()
+
+
+# ----------------------------------------
+# CLI
+# ----------------------------------------
+def reindex():
+    """Build the index from scratch for an existing database."""
+    with SessionLocal() as session:
+        project_ids = session.scalars(
+            select(ResearchProject.id).where(ResearchProject.last_draft_version > 0)
+        ).all()
+        jobs = session.scalars(
+            select(PlagiarismJob).where(PlagiarismJob.status == "completed")
+        ).all()
+
+        for project_id in project_ids:
+            hashes = shingle_hashes(tokenize(latest_draft_text(session, project_id)))
+            if hashes:
+                index_document(session, DRAFT, project_id, project_id, hashes)
+
+        for job in jobs:
+            if submission_available(job):
+                hashes = shingle_hashes(tokenize(extract_text(job.file_path)))
+                if hashes:
+                    index_document(session, SUBMISSION, job.id, job.project_id, hashes)
+
+        session.commit()
+    return len(project_ids), len(jobs)
+
+
+if __name__ == "__main__":
+    from database import engine
+    import models
+    import migrations
+
+    models.Base.metadata.create_all(bind=engine)
+    migrations.run_migrations(engine)
+
+    command = sys.argv[1] if len(sys.argv) > 1 else ""
+    if command == "reindex":
+        projects, submissions = reindex()
+        print(f"Indexed {projects} project drafts and {submissions} submissions")
+    elif command == "check" and len(sys.argv) == 3:
+        import worker
+        worker.process_job(int(sys.argv[2]))
+    else:
+        print("usage: python plagiarism.py reindex | check <job_id>")
+        sys.exit(2)
@@ -0,0 +1,103 @@
+import hashlib
+import os
+import threading
+from typing import NamedTuple
+
+from cachetools import TTLCache
+from fastapi import Request, Response
+import serialization
+from storage import etag_matches
+
+RESPONSE_CACHE_SIZE = int(os.getenv("RESPONSE_CACHE_SIZE", "2048"))
+RESPONSE_CACHE_TTL = int(os.getenv("RESPONSE_CACHE_TTL", "60"))
+
+# Larger bodies (long draft pages) still get an ETag but are not kept
+RESPONSE_CACHE_MAX_BODY = int(os.getenv("RESPONSE_CACHE_MAX_BODY", str(256 * 1024)))
+
+# Clients revalidate every time; unchanged responses cost a 304
+REVALIDATE = "private, no-cache"
+PUBLIC_REVALIDATE = "public, no-cache"
+
+
+class CachedResponse(NamedTuple):
+    version: int
+    body: bytes
+    etag: str
+    headers: dict
+
+
+# Each scope (e.g. the reviews of one project) has a counter that the
+# write endpoints bump; a cached body is served only while the counter
+# it was built under is current. Counters are per process, so the TTL
+# bounds how long another worker process can serve a superseded body.
+_versions: dict[str, int] = {}
+_responses = TTLCache(maxsize=RESPONSE_CACHE_SIZE, ttl=RESPONSE_CACHE_TTL)
+_lock = threading.Lock()
+
+
+def public_projects_scope() -> str:
+    return "public-projects"
+
+
+def project_scope(project_id: int, part: str) -> str:
+    # part: drafts | members | reviews
+    return f"project:{project_id}:{part}"
+
+
+def bump(*scopes: str):
+    with _lock:
+        for scope in scopes:
+            _versions[scope] = _versions.get(scope, 0) + 1
+
+
+def clear():
+    # After bulk loads that touch scopes nobody bumped
+    with _lock:
+        _responses.clear()
+
+
+def _respond(request: Request, entry: CachedResponse, cache_control: str) -> Response:
+    headers = {"etag": entry.etag, "cache-control": cache_control, **entry.headers}
+
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None and etag_matches(if_none_match, entry.etag):
+        return Response(status_code=304, headers=headers)
+
+    return Response(entry.body, media_type="application/json", headers=headers)
+
+
+async def cached_json(
+    request: Request,
+    key,
+    scope: str,
+    build,
+    model,
+    cache_control: str = REVALIDATE,
+    headers=None,
+) -> Response:
+    """Serve build() serialized as model, from cache while scope is unchanged.
+
+    The ETag is the hash of the body, so it is strong and identical across
+    processes. headers(data) adds response headers (e.g. X-Next-Cursor)
+    that are cached with the body.
+    """
+    key = (scope, key)
+    with _lock:
+        version = _versions.get(scope, 0)
+        entry = _responses.get(key)
+
+    if entry is None or entry.version != version:
+        data = await build()
+        body = serialization.dump_json(model, data)
+        entry = CachedResponse(
+            version,
+            body,
+            f'"{hashlib.sha256(body).hexdigest()}"',
+            headers(data) if headers else {},
+        )
+        with _lock:
+            # A write during build() leaves this entry stale; don't keep it
+            if _versions.get(scope, 0) == version and len(body) <= RESPONSE_CACHE_MAX_BODY:
+                _responses[key] = entry
+
+    return _respond(request, entry, cache_control)
@@ -0,0 +1,270 @@
+import heapq
+import math
+from collections import defaultdict
+
+from sqlalchemy import exists, func, insert, select, union
+
+from models import ProjectMember, ResearchProject, Review, ReviewAssignment, User
+from schemas import AutoAssignResult, ProposedAssignment, UnfilledProject
+
+
+def normalize_domain(domain: str | None) -> str:
+    return (domain or "").strip().lower()
+
+
+# ----------------------------------------
+# Loading the problem
+# ----------------------------------------
+async def load_problem(db, project_ids=None):
+    """Projects to staff, the reviewer pool, and what is already known
+    about each reviewer: open load, expertise and conflicts.
+
+    Assignments, reviews and memberships are read for the projects in
+    scope only; load and expertise come back aggregated per reviewer, so
+    the cost does not grow with the whole review history.
+    """
+    if project_ids is None:
+        in_scope = ResearchProject.visibility == "public"
+    else:
+        in_scope = ResearchProject.id.in_(list(project_ids))
+    scope = select(ResearchProject.id).where(in_scope)
+
+    projects = (
+        await db.execute(
+            select(ResearchProject.id, ResearchProject.domain, ResearchProject.owner_id)
+            .where(in_scope)
+            .order_by(ResearchProject.id)
+        )
+    ).all()
+
+    is_reviewer = User.role == "reviewer"
+    reviewers = (
+        await db.scalars(select(User.id).where(is_reviewer).order_by(User.id))
+    ).all()
+
+    assigned = (
+        await db.execute(
+            select(ReviewAssignment.project_id, ReviewAssignment.reviewer_id)
+            .where(ReviewAssignment.project_id.in_(scope))
+        )
+    ).all()
+    reviewed = (
+        await db.execute(
+            select(Review.project_id, Review.reviewer_id)
+            .where(Review.project_id.in_(scope))
+        )
+    ).all()
+
+    # Open load: assignments not yet answered by a review
+    answered = exists().where(
+        Review.project_id == ReviewAssignment.project_id,
+        Review.reviewer_id == ReviewAssignment.reviewer_id,
+    )
+    load = (
+        await db.execute(
+            select(ReviewAssignment.reviewer_id, func.count())
+            .join(User, User.id == ReviewAssignment.reviewer_id)
+            .where(is_reviewer, ~answered)
+            .group_by(ReviewAssignment.reviewer_id)
+        )
+    ).all()
+
+    # Expertise: the distinct domains a reviewer was assigned or reviewed
+    history = union(
+        select(ReviewAssignment.reviewer_id, ResearchProject.domain)
+        .join(ResearchProject, ResearchProject.id == ReviewAssignment.project_id),
+        select(Review.reviewer_id, ResearchProject.domain)
+        .join(ResearchProject, ResearchProject.id == Review.project_id),
+    ).subquery()
+    expertise = (
+        await db.execute(
+            select(history.c.reviewer_id, history.c.domain)
+            .join(User, User.id == history.c.reviewer_id)
+            .where(is_reviewer)
+        )
+    ).all()
+
+    # Only memberships of reviewers can conflict
+    memberships = (
+        await db.execute(
+            select(ProjectMember.project_id, ProjectMember.user_id)
+            .join(User, User.id == ProjectMember.user_id)
+            .where(is_reviewer, ProjectMember.project_id.in_(scope))
+        )
+    ).all()
+
+    return projects, reviewers, assigned, reviewed, load, expertise, memberships
+
+
+# ----------------------------------------
+# Greedy assignment
+# ----------------------------------------
+class ReviewerHeaps:
+    """Min-heaps of (load, reviewer_id), one per domain plus one over all
+    reviewers. Entries go stale when a load changes and are dropped lazily
+    when popped."""
+
+    def __init__(self, load, expertise):
+        self.load = load
+        self.expertise = expertise
+        self.heaps = defaultdict(list)
+        for reviewer_id in load:
+            self.push(reviewer_id)
+
+    def keys(self, reviewer_id):
+        return [None, *self.expertise.get(reviewer_id, ())]
+
+    def push(self, reviewer_id):
+        for key in self.keys(reviewer_id):
+            heapq.heappush(self.heaps[key], (self.load[reviewer_id], reviewer_id))
+
+    def take(self, key, excluded, max_load):
+        """Least-loaded eligible reviewer in heap key, or None."""
+        heap = self.heaps.get(key)
+        skipped = []
+        chosen = None
+        while heap:
+            load, reviewer_id = heap[0]
+            if load != self.load[reviewer_id]:
+                heapq.heappop(heap)
+                continue
+            if load >= max_load:
+                break
+            heapq.heappop(heap)
+            if reviewer_id in excluded:
+                skipped.append((load, reviewer_id))
+                continue
+            chosen = reviewer_id
+            break
+
+        for entry in skipped:
+            heapq.heappush(heap, entry)
+        return chosen
+
+    def assign(self, reviewer_id):
+        self.load[reviewer_id] += 1
+        self.push(reviewer_id)
+
+
+def plan_assignments(
+    projects,
+    reviewers,
+    assigned,
+    reviewed,
+    open_load,
+    history,
+    memberships,
+    reviewers_per_project: int,
+    max_load: int | None = None,
+):
+    """Staff every project with reviewers_per_project reviewers.
+
+    Reviewers whose past reviews or assignments cover the project's domain
+    are preferred, least-loaded first, before falling back to the rest of
+    the pool. Projects with the fewest domain experts are staffed first.
+    Members of a project (including its owner) and reviewers already on it
+    are never chosen.
+    """
+    on_project = defaultdict(set)
+    for project_id, reviewer_id in assigned:
+        on_project[project_id].add(reviewer_id)
+
+    load = {reviewer_id: 0 for reviewer_id in reviewers}
+    for reviewer_id, count in open_load:
+        if reviewer_id in load:
+            load[reviewer_id] = count
+
+    expertise = defaultdict(set)
+    for reviewer_id, domain in history:
+        if reviewer_id in load:
+            expertise[reviewer_id].add(normalize_domain(domain))
+
+    conflicts = defaultdict(set)
+    for project_id, user_id in memberships:
+        conflicts[project_id].add(user_id)
+    for project_id, reviewer_id in reviewed:
+        conflicts[project_id].add(reviewer_id)
+
+    needed = {
+        project.id: max(reviewers_per_project - len(on_project[project.id]), 0)
+        for project in projects
+    }
+    if max_load is None:
+        # Even spread of all open work, plus one of slack for domain matching
+        total = sum(load.values()) + sum(needed.values())
+        max_load = math.ceil(total / len(reviewers)) + 1 if reviewers else 0
+
+    experts = defaultdict(int)
+    for domains in expertise.values():
+        for domain in domains:
+            experts[domain] += 1
+
+    order = sorted(
+        (project for project in projects if needed[project.id]),
+        key=lambda project: (experts[normalize_domain(project.domain)], project.id),
+    )
+
+    heaps = ReviewerHeaps(load, expertise)
+    proposed = []
+    unfilled = []
+
+    for project in order:
+        domain = normalize_domain(project.domain)
+        excluded = on_project[project.id] | conflicts[project.id] | {project.owner_id}
+
+        for _ in range(needed[project.id]):
+            reviewer_id = heaps.take(domain, excluded, max_load)
+            match = reviewer_id is not None
+            if reviewer_id is None:
+                reviewer_id = heaps.take(None, excluded, max_load)
+            if reviewer_id is None:
+                break
+
+            heaps.assign(reviewer_id)
+            excluded.add(reviewer_id)
+            on_project[project.id].add(reviewer_id)
+            proposed.append(ProposedAssignment(
+                project_id=project.id,
+                reviewer_id=reviewer_id,
+                domain_match=match,
+            ))
+
+        missing = reviewers_per_project - len(on_project[project.id])
+        if missing > 0:
+            unfilled.append(UnfilledProject(project_id=project.id, missing=missing))
+
+    return proposed, unfilled, max_load
+
+
+async def auto_assign(
+    db,
+    editor_id: int,
+    project_ids=None,
+    reviewers_per_project: int = 2,
+    max_load: int | None = None,
+    dry_run: bool = False,
+) -> AutoAssignResult:
+    problem = await load_problem(db, set(project_ids) if project_ids is not None else None)
+    proposed, unfilled, max_load = plan_assignments(
+        *problem, reviewers_per_project, max_load
+    )
+
+    if proposed and not dry_run:
+        # One multi-row INSERT; the unique (project_id, reviewer_id) index
+        # rejects the batch if a concurrent assignment got there first
+        await db.execute(insert(ReviewAssignment), [
+            {
+                "project_id": item.project_id,
+                "reviewer_id": item.reviewer_id,
+                "assigned_by": editor_id,
+            }
+            for item in proposed
+        ])
+        await db.commit()
+
+    return AutoAssignResult(
+        assignments=proposed,
+        unfilled=unfilled,
+        max_load=max_load,
+        dry_run=dry_run,
+    )
@@ -1,5 +1,6 @@
-from pydantic import BaseModel, EmailStr
+from pydantic import BaseModel, EmailStr, Field
 from datetime import datetime
+from typing import Any
 from pydantic import BaseModel, EmailStr
 
 class UserCreate(BaseModel):
@@ -30,6 +31,14 @@ class ProjectResponse(BaseModel):
         from_attributes = True
 
 
+class ProjectSearchResult(ProjectResponse):
+    # HTML-escaped text with matched terms wrapped in <mark>; None when
+    # FTS5 is unavailable
+    title_highlight: str | None = None
+    snippet: str | None = None
+    rank: float | None = None
+
+
 from pydantic import BaseModel, EmailStr
 
 class InviteMember(BaseModel):
@@ -69,6 +78,15 @@ class DraftResponse(BaseModel):
     class Config:
         from_attributes = True
 
+class DraftSummary(BaseModel):
+    id: int
+    version: int
+    created_by: int
+    author_name: str
+    created_at: datetime
+    size: int | None = None  # None until `python drafts.py` backfills old rows
+    content_hash: str | None = None
+
 class UserResponse(BaseModel):
     id: int
     name: str
@@ -97,6 +115,41 @@ class ReviewResponse(BaseModel):
 
 
 
+class ReviewSummary(BaseModel):
+    project_id: int
+    count: int
+    mean: float | None = None
+    stddev: float | None = None
+    min: int | None = None
+    max: int | None = None
+
+
+class LeaderboardEntry(ReviewSummary):
+    title: str
+    domain: str
+
+
+class PlagiarismJobResponse(BaseModel):
+    id: int
+    user_id: int
+    project_id: int
+    file_path: str
+    report_path: str | None = None
+    content_hash: str | None = None
+    similarity: float | None = None
+    status: str | None = None
+    attempts: int | None = None
+    last_error: str | None = None
+    next_attempt_at: datetime | None = None
+    lease_owner: str | None = None
+    lease_expires_at: datetime | None = None
+    created_at: datetime | None = None
+    completed_at: datetime | None = None
+
+    class Config:
+        from_attributes = True
+
+
 class AssignReviewer(BaseModel):
     project_id: int
     reviewer_email: EmailStr
@@ -111,3 +164,87 @@ class AssignmentResponse(BaseModel):
 
     class Config:
         from_attributes = True
+
+
+class AutoAssignReviewers(BaseModel):
+    project_ids: list[int] | None = None  # default: every public project
+    reviewers_per_project: int = Field(2, ge=1, le=10)
+    max_load: int | None = Field(None, ge=1)  # open assignments per reviewer
+    dry_run: bool = False
+
+
+class ProposedAssignment(BaseModel):
+    project_id: int
+    reviewer_id: int
+    domain_match: bool
+
+
+class UnfilledProject(BaseModel):
+    project_id: int
+    missing: int
+
+
+class AutoAssignResult(BaseModel):
+    assignments: list[ProposedAssignment]
+    unfilled: list[UnfilledProject]
+    max_load: int
+    dry_run: bool
+
+
+# ----------------------------------------
+# Bulk writes
+# ----------------------------------------
+MAX_BULK_ITEMS = 500
+
+
+class BulkInviteMembers(BaseModel):
+    project_id: int
+    emails: list[EmailStr] = Field(..., min_length=1, max_length=MAX_BULK_ITEMS)
+
+
+class RoleChange(BaseModel):
+    user_id: int
+    role: str
+
+
+class BulkRoleChange(BaseModel):
+    changes: list[RoleChange] = Field(..., min_length=1, max_length=MAX_BULK_ITEMS)
+
+
+class BulkAssignReviewers(BaseModel):
+    assignments: list[AssignReviewer] = Field(..., min_length=1, max_length=MAX_BULK_ITEMS)
+
+
+class BulkItemResult(BaseModel):
+    index: int  # position of the item in the request
+    status: str  # ok | error
+    detail: str | None = None
+
+
+class BulkResult(BaseModel):
+    succeeded: int
+    failed: int
+    results: list[BulkItemResult]
+
+
+# ----------------------------------------
+# Slow queries
+# ----------------------------------------
+class SlowQuery(BaseModel):
+    fingerprint: str
+    statement: str  # normalized: literals and IN lists replaced by ?
+    count: int
+    total_ms: float
+    mean_ms: float
+    max_ms: float
+    routes: dict[str, int]
+    parameters: Any = None  # redacted sample: types and lengths only
+    plan: list[str]
+    full_scan: bool
+    last_seen: datetime
+
+
+class SlowQueryReport(BaseModel):
+    enabled: bool
+    threshold_ms: float | None
+    queries: list[SlowQuery]
@@ -0,0 +1,135 @@
+import math
+
+from sqlalchemy import and_, case, or_, select, text
+
+from database import dialect_insert
+from models import ResearchProject, ReviewStats
+from schemas import LeaderboardEntry, ReviewSummary
+
+
+# ----------------------------------------
+# Maintaining aggregates
+# ----------------------------------------
+def record_review_statement(project_id: int, score: int):
+    """Folds one new review into the project's aggregates; execute it in the
+    transaction that inserts the review."""
+    stmt = dialect_insert(ReviewStats).values(
+        project_id=project_id,
+        review_count=1,
+        score_sum=score,
+        score_sq_sum=score * score,
+        score_min=score,
+        score_max=score,
+        mean_score=float(score),
+    )
+    stats = ReviewStats.__table__.c
+    return stmt.on_conflict_do_update(
+        index_elements=[stats.project_id],
+        set_={
+            "review_count": stats.review_count + 1,
+            "score_sum": stats.score_sum + score,
+            "score_sq_sum": stats.score_sq_sum + score * score,
+            "score_min": case((stats.score_min <= score, stats.score_min), else_=score),
+            "score_max": case((stats.score_max >= score, stats.score_max), else_=score),
+            "mean_score": (stats.score_sum + score) * 1.0 / (stats.review_count + 1),
+        },
+    )
+
+
+def rebuild_review_stats(conn):
+    """Recompute every project's aggregates from the reviews table."""
+    conn.execute(text("DELETE FROM review_stats"))
+    conn.execute(text(
+        "INSERT INTO review_stats (project_id, review_count, score_sum, "
+        "score_sq_sum, score_min, score_max, mean_score) "
+        "SELECT project_id, COUNT(*), SUM(score), SUM(score * score), "
+        "MIN(score), MAX(score), AVG(score * 1.0) "
+        "FROM reviews GROUP BY project_id"
+    ))
+
+
+# ----------------------------------------
+# Reading
+# ----------------------------------------
+def stddev(count, score_sum, score_sq_sum):
+    if not count:
+        return None
+    mean = score_sum / count
+    # Population standard deviation; clamp float error below zero
+    return math.sqrt(max(score_sq_sum / count - mean * mean, 0.0))
+
+
+def summary_fields(row) -> dict:
+    project_id, count, score_sum, score_sq_sum, score_min, score_max, mean = row
+    return {
+        "project_id": project_id,
+        "count": count or 0,
+        "mean": mean,
+        "stddev": stddev(count, score_sum, score_sq_sum),
+        "min": score_min,
+        "max": score_max,
+    }
+
+
+STATS_COLUMNS = (
+    ReviewStats.project_id,
+    ReviewStats.review_count,
+    ReviewStats.score_sum,
+    ReviewStats.score_sq_sum,
+    ReviewStats.score_min,
+    ReviewStats.score_max,
+    ReviewStats.mean_score,
+)
+
+
+async def project_summary(db, project_id: int) -> ReviewSummary:
+    row = (
+        await db.execute(select(*STATS_COLUMNS).where(ReviewStats.project_id == project_id))
+    ).first()
+    if row is None:
+        return ReviewSummary(project_id=project_id, count=0)
+    return ReviewSummary(**summary_fields(row))
+
+
+def leaderboard_cursor(entry: LeaderboardEntry) -> str:
+    return f"{entry.mean!r},{entry.project_id}"
+
+
+def parse_leaderboard_cursor(cursor: str):
+    mean, project_id = cursor.rsplit(",", 1)
+    return float(mean), int(project_id)
+
+
+async def leaderboard(db, limit: int, cursor=None, domain=None, min_reviews: int = 1):
+    """Public projects by mean score (best first, ties newest first),
+    keyset-paginated on (mean_score, project_id) by walking the index
+    backwards."""
+    query = (
+        select(*STATS_COLUMNS, ResearchProject.title, ResearchProject.domain)
+        .join(ResearchProject, ResearchProject.id == ReviewStats.project_id)
+        .where(
+            ResearchProject.visibility == "public",
+            ReviewStats.review_count >= min_reviews,
+        )
+    )
+    if domain is not None:
+        query = query.where(ResearchProject.domain == domain)
+    if cursor is not None:
+        mean, project_id = cursor
+        query = query.where(or_(
+            ReviewStats.mean_score < mean,
+            and_(ReviewStats.mean_score == mean, ReviewStats.project_id < project_id),
+        ))
+
+    rows = (
+        await db.execute(
+            query
+            .order_by(ReviewStats.mean_score.desc(), ReviewStats.project_id.desc())
+            .limit(limit)
+        )
+    ).all()
+
+    return [
+        LeaderboardEntry(**summary_fields(row[:7]), title=row[7], domain=row[8])
+        for row in rows
+    ]
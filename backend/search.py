@@ -0,0 +1,172 @@
+import html
+import re
+
+from sqlalchemy import or_, select, text
+
+from database import DATABASE_URL, is_sqlite
+from models import ResearchProject
+from schemas import ProjectSearchResult
+
+# Relative bm25 weight of title, abstract and domain matches
+TITLE_WEIGHT = 10.0
+ABSTRACT_WEIGHT = 1.0
+DOMAIN_WEIGHT = 5.0
+
+SNIPPET_TOKENS = 24
+MARK_OPEN = "<mark>"
+MARK_CLOSE = "</mark>"
+
+# FTS5 wraps matches in these private-use characters; the text around
+# them is user content, escaped before they become MARK_OPEN/MARK_CLOSE
+MATCH_START = "\ue000"
+MATCH_END = "\ue001"
+
+
+# ----------------------------------------
+# Index
+# ----------------------------------------
+# project_search holds one row per public project, rowid = project id.
+# Triggers keep it in sync with research_projects, so every writer
+# (including the visibility endpoint and imports) maintains it. The
+# update trigger is limited to the indexed columns, so draft saves that
+# bump last_draft_version never touch the index.
+SEARCH_DDL = [
+    "CREATE VIRTUAL TABLE IF NOT EXISTS project_search USING fts5("
+    "title, abstract, domain, tokenize = 'porter unicode61')",
+
+    "CREATE TRIGGER IF NOT EXISTS project_search_insert "
+    "AFTER INSERT ON research_projects WHEN new.visibility = 'public' BEGIN "
+    "INSERT INTO project_search (rowid, title, abstract, domain) "
+    "VALUES (new.id, new.title, new.abstract, new.domain); END",
+
+    "CREATE TRIGGER IF NOT EXISTS project_search_update "
+    "AFTER UPDATE OF title, abstract, domain, visibility ON research_projects BEGIN "
+    "DELETE FROM project_search WHERE rowid = old.id; "
+    "INSERT INTO project_search (rowid, title, abstract, domain) "
+    "SELECT new.id, new.title, new.abstract, new.domain "
+    "WHERE new.visibility = 'public'; END",
+
+    "CREATE TRIGGER IF NOT EXISTS project_search_delete "
+    "AFTER DELETE ON research_projects BEGIN "
+    "DELETE FROM project_search WHERE rowid = old.id; END",
+]
+
+
+def create_search_index(conn):
+    """Create and fill project_search; a no-op outside SQLite."""
+    if conn.dialect.name != "sqlite":
+        return
+
+    for ddl in SEARCH_DDL:
+        conn.execute(text(ddl))
+
+    conn.execute(text("DELETE FROM project_search"))
+    conn.execute(text(
+        "INSERT INTO project_search (rowid, title, abstract, domain) "
+        "SELECT id, title, abstract, domain FROM research_projects "
+        "WHERE visibility = 'public'"
+    ))
+
+
+# ----------------------------------------
+# Queries
+# ----------------------------------------
+def match_expression(query: str) -> str | None:
+    # User input is never passed as FTS syntax: every word becomes a quoted
+    # prefix term, and all of them must match
+    terms = re.findall(r"\w+", query)
+    if not terms:
+        return None
+    return " ".join(f'"{term}"*' for term in terms)
+
+
+SEARCH_SQL = (
+    "SELECT p.id, p.title, p.abstract, p.domain, p.visibility, "
+    f"highlight(project_search, 0, '{MATCH_START}', '{MATCH_END}'), "
+    f"snippet(project_search, 1, '{MATCH_START}', '{MATCH_END}', '…', {SNIPPET_TOKENS}), "
+    f"bm25(project_search, {TITLE_WEIGHT}, {ABSTRACT_WEIGHT}, {DOMAIN_WEIGHT}) AS rank "
+    "FROM project_search JOIN research_projects AS p ON p.id = project_search.rowid "
+    "WHERE project_search MATCH :match AND p.visibility = 'public' {domain} "
+    "ORDER BY rank, p.id LIMIT :limit OFFSET :offset"
+)
+
+
+def marked_html(fragment: str | None) -> str | None:
+    """An FTS5 highlight as HTML: the text escaped, matches in <mark>."""
+    if fragment is None:
+        return None
+    return (
+        html.escape(fragment)
+        .replace(MATCH_START, MARK_OPEN)
+        .replace(MATCH_END, MARK_CLOSE)
+    )
+
+
+async def search_public_projects(db, query: str, domains=None, limit: int = 20, offset: int = 0):
+    """Ranked public projects matching query, best first."""
+    match = match_expression(query)
+    if match is None:
+        return []
+
+    if not is_sqlite(DATABASE_URL):
+        return await search_fallback(db, query, domains, limit, offset)
+
+    params = {"match": match, "limit": limit, "offset": offset}
+    domain_clause = ""
+    if domains:
+        names = [f":domain_{i}" for i in range(len(domains))]
+        params.update({name[1:]: domain for name, domain in zip(names, domains)})
+        domain_clause = f"AND p.domain IN ({', '.join(names)})"
+
+    rows = (
+        await db.execute(text(SEARCH_SQL.format(domain=domain_clause)), params)
+    ).all()
+
+    return [
+        ProjectSearchResult(
+            id=id,
+            title=title,
+            abstract=abstract,
+            domain=domain,
+            visibility=visibility,
+            title_highlight=marked_html(title_highlight),
+            snippet=marked_html(snippet),
+            rank=rank,
+        )
+        for id, title, abstract, domain, visibility, title_highlight, snippet, rank in rows
+    ]
+
+
+async def search_fallback(db, query, domains, limit, offset):
+    # Unranked substring match for databases without FTS5
+    conditions = [ResearchProject.visibility == "public"]
+    for term in re.findall(r"\w+", query):
+        pattern = f"%{term}%"
+        conditions.append(or_(
+            ResearchProject.title.ilike(pattern),
+            ResearchProject.abstract.ilike(pattern),
+            ResearchProject.domain.ilike(pattern),
+        ))
+    if domains:
+        conditions.append(ResearchProject.domain.in_(domains))
+
+    projects = (
+        await db.scalars(
+            select(ResearchProject)
+            .where(*conditions)
+            .order_by(ResearchProject.id)
+            .limit(limit)
+            .offset(offset)
+        )
+    ).all()
+
+    return [
+        ProjectSearchResult(
+            id=project.id,
+            title=project.title,
+            abstract=project.abstract,
+            domain=project.domain,
+            visibility=project.visibility,
+        )
+        for project in projects
+    ]
@@ -0,0 +1,31 @@
+import threading
+
+from pydantic import TypeAdapter
+
+_adapters: dict = {}
+_lock = threading.Lock()
+
+
+def columns(entity, schema):
+    """The columns of entity that schema serializes.
+
+    Selecting these instead of the entity returns plain rows, which the
+    from_attributes schemas read directly, so list endpoints skip ORM
+    identity-map and instance bookkeeping for every row.
+    """
+    return [getattr(entity, name) for name in schema.model_fields]
+
+
+def adapter(model) -> TypeAdapter:
+    # Building a TypeAdapter compiles its validator and serializer; do it
+    # once per type
+    with _lock:
+        compiled = _adapters.get(model)
+        if compiled is None:
+            compiled = _adapters[model] = TypeAdapter(model)
+        return compiled
+
+
+def dump_json(model, rows) -> bytes:
+    compiled = adapter(model)
+    return compiled.dump_json(compiled.validate_python(rows, from_attributes=True))
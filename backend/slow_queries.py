@@ -0,0 +1,203 @@
+import hashlib
+import logging
+import os
+import re
+import threading
+import time
+from datetime import datetime
+
+from sqlalchemy import event
+
+import metrics
+from migrations import uses_index
+from schemas import SlowQuery
+
+logger = logging.getLogger("acadflow.slow_queries")
+
+# Opt-in: statements slower than this many milliseconds are logged and
+# aggregated; unset disables the hooks entirely
+SLOW_QUERY_MS = float(os.environ["SLOW_QUERY_MS"]) if os.getenv("SLOW_QUERY_MS") else None
+
+# Distinct statements kept; slow statements beyond that are logged only
+SLOW_QUERY_MAX_FINGERPRINTS = int(os.getenv("SLOW_QUERY_MAX_FINGERPRINTS", "500"))
+
+# The plan is captured once per fingerprint, on its first slow run
+SLOW_QUERY_EXPLAIN = os.getenv("SLOW_QUERY_EXPLAIN", "1") == "1"
+
+EXPLAIN_PREFIX = {"sqlite": "EXPLAIN QUERY PLAN ", "postgresql": "EXPLAIN "}
+
+
+class Entry:
+    __slots__ = ("statement", "count", "total", "max", "routes", "parameters", "plan", "last_seen")
+
+    def __init__(self, statement: str, plan: list[str]):
+        self.statement = statement
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.routes: dict[str, int] = {}
+        self.parameters = None
+        self.plan = plan
+        self.last_seen = None
+
+
+_entries: dict[str, Entry] = {}
+_lock = threading.Lock()
+
+
+# ----------------------------------------
+# Normalizing
+# ----------------------------------------
+def normalize(statement: str) -> str:
+    statement = " ".join(statement.split())
+    statement = re.sub(r"'(?:[^']|'')*'", "?", statement)
+    statement = re.sub(r"\b\d+(?:\.\d+)?\b", "?", statement)
+    # IN lists of any length are the same statement
+    return re.sub(r"\(\?(?:, \?)+\)", "(?, ...)", statement)
+
+
+def fingerprint(normalized: str) -> str:
+    return hashlib.sha1(normalized.encode("utf-8")).hexdigest()[:12]
+
+
+def redact_value(value):
+    # Keep the shape of a parameter (type, length), never its value
+    if value is None:
+        return None
+    if isinstance(value, (str, bytes)):
+        return f"{type(value).__name__}({len(value)})"
+    return type(value).__name__
+
+
+def redact(parameters, executemany: bool):
+    if executemany:
+        rows = list(parameters)
+        return {"rows": len(rows), "first": redact(rows[0], False) if rows else None}
+    if isinstance(parameters, dict):
+        return {name: redact_value(value) for name, value in parameters.items()}
+    if isinstance(parameters, (list, tuple)):
+        return [redact_value(value) for value in parameters]
+    return redact_value(parameters)
+
+
+# ----------------------------------------
+# Capturing
+# ----------------------------------------
+def explain(conn, statement: str, parameters, executemany: bool) -> list[str]:
+    prefix = EXPLAIN_PREFIX.get(conn.dialect.name)
+    if prefix is None:
+        return []
+    if executemany:
+        parameters = next(iter(parameters), ())
+
+    # A separate cursor, so the slow statement's result set is untouched
+    try:
+        cursor = conn.connection.cursor()
+        try:
+            cursor.execute(prefix + statement, parameters)
+            rows = cursor.fetchall()
+        finally:
+            cursor.close()
+    except Exception as exc:
+        return [f"unavailable: {exc}"]
+    # SQLite: (id, parent, notused, detail); PostgreSQL: one text column
+    return [str(row[-1]) for row in rows]
+
+
+def full_scan(plan) -> bool:
+    return any(
+        (step.startswith("SCAN ") and not uses_index(step) and "VIRTUAL TABLE" not in step)
+        or step.startswith("Seq Scan")
+        for step in plan
+    )
+
+
+def record(conn, statement: str, parameters, executemany: bool, seconds: float):
+    normalized = normalize(statement)
+    key = fingerprint(normalized)
+    route = metrics.current_route() or "-"
+    redacted = redact(parameters, executemany)
+
+    with _lock:
+        entry = _entries.get(key)
+        known = entry is not None
+        full = len(_entries) >= SLOW_QUERY_MAX_FINGERPRINTS
+
+    plan = entry.plan if known else []
+    if not known and not full and SLOW_QUERY_EXPLAIN:
+        plan = explain(conn, statement, parameters, executemany)
+
+    if not full or known:
+        with _lock:
+            entry = _entries.get(key)
+            if entry is None:
+                entry = _entries[key] = Entry(normalized, plan)
+            entry.count += 1
+            entry.total += seconds
+            entry.max = max(entry.max, seconds)
+            entry.routes[route] = entry.routes.get(route, 0) + 1
+            entry.parameters = redacted
+            entry.last_seen = datetime.utcnow()
+
+    logger.warning(
+        "Slow query %.1f ms [%s] %s %s params=%s plan=%s",
+        seconds * 1000, route, key, normalized, redacted, "; ".join(plan),
+    )
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    context._slow_query_started = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started = getattr(context, "_slow_query_started", None)
+    if started is None:
+        return
+    seconds = time.perf_counter() - started
+    if seconds * 1000 >= SLOW_QUERY_MS:
+        record(conn, statement, parameters, executemany, seconds)
+
+
+def instrument_engine(engine):
+    """Log slow statements run on engine; a no-op unless SLOW_QUERY_MS is set."""
+    if SLOW_QUERY_MS is None:
+        return
+    event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+
+
+# ----------------------------------------
+# Reporting
+# ----------------------------------------
+SORT_KEYS = {
+    "total": lambda entry: entry.total,
+    "count": lambda entry: entry.count,
+    "max": lambda entry: entry.max,
+    "mean": lambda entry: entry.total / entry.count,
+}
+
+
+def top(limit: int = 20, sort: str = "total") -> list[SlowQuery]:
+    with _lock:
+        entries = sorted(_entries.items(), key=lambda item: SORT_KEYS[sort](item[1]), reverse=True)
+        return [
+            SlowQuery(
+                fingerprint=key,
+                statement=entry.statement,
+                count=entry.count,
+                total_ms=round(entry.total * 1000, 3),
+                mean_ms=round(entry.total * 1000 / entry.count, 3),
+                max_ms=round(entry.max * 1000, 3),
+                routes=dict(entry.routes),
+                parameters=entry.parameters,
+                plan=list(entry.plan),
+                full_scan=full_scan(entry.plan),
+                last_seen=entry.last_seen,
+            )
+            for key, entry in entries[:limit]
+        ]
+
+
+def reset():
+    with _lock:
+        _entries.clear()
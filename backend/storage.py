@@ -0,0 +1,228 @@
+import hashlib
+import mimetypes
+import os
+import tempfile
+from email.utils import formatdate, parsedate_to_datetime
+from typing import NamedTuple
+
+from fastapi import HTTPException, Request, UploadFile
+from starlette.concurrency import run_in_threadpool
+from starlette.responses import FileResponse, JSONResponse, Response
+
+UPLOAD_ROOT = os.getenv("UPLOAD_ROOT", "uploads")
+MAX_UPLOAD_BYTES = int(os.getenv("MAX_UPLOAD_BYTES", str(100 * 1024 * 1024)))
+CHUNK_SIZE = 1024 * 1024
+
+# multipart framing around the file itself
+REQUEST_OVERHEAD = 64 * 1024
+
+# When set (e.g. "/protected"), files are handed to nginx with
+# X-Accel-Redirect so it can sendfile() them instead of Python streaming
+ACCEL_REDIRECT_PREFIX = os.getenv("ACCEL_REDIRECT_PREFIX")
+
+# Stored files never change once written
+IMMUTABLE_CACHE_CONTROL = "private, max-age=31536000, immutable"
+
+# For URLs whose body can be replaced; each use costs a conditional
+# request, answered with 304 while the ETag still matches
+REVALIDATE_CACHE_CONTROL = "private, no-cache"
+
+
+class StoredFile(NamedTuple):
+    path: str
+    sha256: str
+    size: int
+    created: bool
+
+
+# ----------------------------------------
+# Content-addressed storage
+# ----------------------------------------
+def is_stored_path(path: str) -> bool:
+    """Whether path (after resolving symlinks and "..") is under UPLOAD_ROOT."""
+    root = os.path.realpath(UPLOAD_ROOT)
+    return os.path.commonpath([root, os.path.realpath(path)]) == root
+
+
+def content_path(area: str, sha256: str, extension: str) -> str:
+    # Two levels of sharding keep directories small
+    return os.path.join(UPLOAD_ROOT, area, sha256[:2], sha256[2:4], sha256 + extension)
+
+
+def _commit_file(tmp_path: str, path: str) -> bool:
+    if os.path.exists(path):
+        os.unlink(tmp_path)
+        return False
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    os.replace(tmp_path, path)
+    return True
+
+
+async def store_upload(upload: UploadFile, area: str, max_bytes: int = MAX_UPLOAD_BYTES) -> StoredFile:
+    """Stream an upload to disk in chunks, hashing as it goes.
+
+    Identical content maps to the same path, so a resubmission reuses the
+    existing file instead of writing a new one.
+    """
+    tmp_dir = os.path.join(UPLOAD_ROOT, "tmp")
+    os.makedirs(tmp_dir, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=tmp_dir)
+
+    digest = hashlib.sha256()
+    size = 0
+    try:
+        with os.fdopen(fd, "wb") as out:
+            while chunk := await upload.read(CHUNK_SIZE):
+                size += len(chunk)
+                if size > max_bytes:
+                    raise HTTPException(status_code=413, detail="File too large")
+                digest.update(chunk)
+                await run_in_threadpool(out.write, chunk)
+
+        sha256 = digest.hexdigest()
+        extension = os.path.splitext(upload.filename or "")[1].lower()
+        path = content_path(area, sha256, extension)
+        created = await run_in_threadpool(_commit_file, tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+        raise
+
+    return StoredFile(path, sha256, size, created)
+
+
+def store_bytes(data: bytes, area: str, extension: str) -> StoredFile:
+    """Content-addressed write of a generated file (e.g. a report)."""
+    sha256 = hashlib.sha256(data).hexdigest()
+    path = content_path(area, sha256, extension)
+    if os.path.exists(path):
+        return StoredFile(path, sha256, len(data), False)
+
+    tmp_dir = os.path.join(UPLOAD_ROOT, "tmp")
+    os.makedirs(tmp_dir, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=tmp_dir)
+    with os.fdopen(fd, "wb") as out:
+        out.write(data)
+
+    return StoredFile(path, sha256, len(data), _commit_file(tmp_path, path))
+
+
+# ----------------------------------------
+# Serving stored files
+# ----------------------------------------
+def file_etag(path: str, stat_result) -> str:
+    # Content-addressed files are named after their sha256
+    name = os.path.splitext(os.path.basename(path))[0]
+    if len(name) == 64 and all(c in "0123456789abcdef" for c in name):
+        return f'"{name}"'
+
+    base = f"{path}-{stat_result.st_mtime_ns}-{stat_result.st_size}"
+    return f'"{hashlib.sha256(base.encode()).hexdigest()}"'
+
+
+def etag_matches(if_none_match: str, etag: str) -> bool:
+    tags = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+    return "*" in tags or etag in tags
+
+
+def not_modified(request: Request, etag: str, last_modified: float) -> bool:
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        return etag_matches(if_none_match, etag)
+
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since:
+        try:
+            since = parsedate_to_datetime(if_modified_since).timestamp()
+        except (TypeError, ValueError):
+            return False
+        return int(last_modified) <= since
+
+    return False
+
+
+def serve_file(
+    request: Request,
+    path: str,
+    filename: str,
+    media_type: str | None = None,
+    cache_control: str = IMMUTABLE_CACHE_CONTROL,
+):
+    """FileResponse with strong validators, 304s and (by default) immutable caching.
+
+    Range and If-Range requests (206) are answered by FileResponse, which
+    also uses the zero-copy http.response.pathsend extension when the
+    server offers it. Only files under UPLOAD_ROOT are served.
+    """
+    if not is_stored_path(path):
+        raise HTTPException(status_code=404, detail="File not found")
+
+    stat_result = os.stat(path)
+    etag = file_etag(path, stat_result)
+    headers = {
+        "etag": etag,
+        "last-modified": formatdate(stat_result.st_mtime, usegmt=True),
+        "cache-control": cache_control,
+        "accept-ranges": "bytes",
+    }
+
+    if not_modified(request, etag, stat_result.st_mtime):
+        return Response(status_code=304, headers=headers)
+
+    media_type = media_type or mimetypes.guess_type(filename)[0] or "application/octet-stream"
+
+    if ACCEL_REDIRECT_PREFIX:
+        relative = os.path.relpath(path, UPLOAD_ROOT).replace(os.sep, "/")
+        headers["x-accel-redirect"] = f"{ACCEL_REDIRECT_PREFIX.rstrip('/')}/{relative}"
+        headers["content-disposition"] = f'attachment; filename="{filename}"'
+        return Response(media_type=media_type, headers=headers)
+
+    return FileResponse(
+        path,
+        media_type=media_type,
+        filename=filename,
+        headers=headers,
+        stat_result=stat_result,
+    )
+
+
+# ----------------------------------------
+# Request size limit
+# ----------------------------------------
+class UploadLimitMiddleware:
+    """Rejects oversized request bodies before they are parsed.
+
+    Starlette spools multipart bodies to disk before the route runs, so the
+    limit has to be enforced here, both from Content-Length and while the
+    body streams in (for chunked requests).
+    """
+
+    def __init__(self, app, max_bytes: int = MAX_UPLOAD_BYTES + REQUEST_OVERHEAD):
+        self.app = app
+        self.max_bytes = max_bytes
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        headers = dict(scope["headers"])
+        length = headers.get(b"content-length")
+        if length is not None and length.isdigit() and int(length) > self.max_bytes:
+            response = JSONResponse({"detail": "File too large"}, status_code=413)
+            await response(scope, receive, send)
+            return
+
+        received = 0
+
+        async def limited_receive():
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > self.max_bytes:
+                    raise HTTPException(status_code=413, detail="File too large")
+            return message
+
+        await self.app(scope, limited_receive, send)
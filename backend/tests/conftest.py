@@ -0,0 +1,8 @@
+import os
+import sys
+
+# The backend is a flat set of modules run from its own directory
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Importing them must never touch the checked-in acadflow.db
+os.environ.setdefault("DATABASE_URL", "sqlite:///:memory:")
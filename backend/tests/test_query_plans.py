@@ -0,0 +1,52 @@
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.schema import CreateTable
+
+import migrations
+import models
+
+
+@pytest.fixture
+def engine(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'plans.db'}")
+    yield engine
+    engine.dispose()
+
+
+def create_tables_without_indexes(engine):
+    # A database created before the indexes existed: the tables only
+    with engine.begin() as conn:
+        for table in models.Base.metadata.sorted_tables:
+            conn.execute(CreateTable(table))
+
+
+def test_hot_paths_scan_before_migrations(engine):
+    create_tables_without_indexes(engine)
+
+    plans = migrations.explain_hot_paths(engine)
+
+    assert plans.keys() == migrations.HOT_PATHS.keys()
+    for name, plan in plans.items():
+        assert "SCAN" in plan and not migrations.uses_index(plan), name
+
+
+def test_hot_paths_use_indexes_after_migrations(engine):
+    create_tables_without_indexes(engine)
+
+    migrations.run_migrations(engine)
+    # Statements cached on pooled connections keep their old plans
+    engine.dispose()
+
+    for name, plan in migrations.explain_hot_paths(engine).items():
+        assert migrations.uses_index(plan), f"{name}: {plan}"
+
+
+def test_migrations_run_once(engine):
+    create_tables_without_indexes(engine)
+
+    migrations.run_migrations(engine)
+    migrations.run_migrations(engine)
+
+    assert migrations.applied_versions(engine) == {
+        version for version, _, _ in migrations.MIGRATIONS
+    }
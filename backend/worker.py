@@ -0,0 +1,341 @@
+import argparse
+import logging
+import os
+import signal
+import socket
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime, timedelta
+
+from sqlalchemy import and_, or_, select, update
+
+from database import SessionLocal, engine
+from models import PlagiarismJob
+from events import hub
+import plagiarism
+
+logger = logging.getLogger("acadflow.worker")
+
+WORKER_PROCESSES = int(os.getenv("PLAGIARISM_WORKERS", str(os.cpu_count() or 2)))
+LEASE_SECONDS = int(os.getenv("PLAGIARISM_LEASE_SECONDS", "120"))
+HEARTBEAT_SECONDS = LEASE_SECONDS // 3
+POLL_SECONDS = float(os.getenv("PLAGIARISM_POLL_SECONDS", "2"))
+MAX_ATTEMPTS = int(os.getenv("PLAGIARISM_MAX_ATTEMPTS", "3"))
+BACKOFF_SECONDS = int(os.getenv("PLAGIARISM_BACKOFF_SECONDS", "30"))
+
+# Inline jobs are retried in place after this delay instead of the
+# backoff schedule, which only the worker poll loop acts on
+INLINE_RETRY_SECONDS = float(os.getenv("PLAGIARISM_INLINE_RETRY_SECONDS", "1"))
+
+
+def new_owner(kind: str = "worker") -> str:
+    return f"{kind}:{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+
+# ----------------------------------------
+# Leases
+# ----------------------------------------
+def claimable(now: datetime):
+    return or_(
+        and_(
+            PlagiarismJob.status == "queued",
+            or_(
+                PlagiarismJob.next_attempt_at.is_(None),
+                PlagiarismJob.next_attempt_at <= now,
+            ),
+        ),
+        # The worker holding the lease stopped heartbeating
+        and_(
+            PlagiarismJob.status == "processing",
+            PlagiarismJob.lease_expires_at < now,
+            PlagiarismJob.attempts < MAX_ATTEMPTS,
+        ),
+    )
+
+
+def claim_job(session, owner: str, job_id: int | None = None) -> int | None:
+    """Atomically lease the oldest claimable job (or job_id) to owner.
+
+    The UPDATE re-checks the claim condition, so when two workers race for
+    the same row only one of them sees a rowcount of 1.
+    """
+    for _ in range(5):
+        now = datetime.utcnow()
+        candidate = job_id
+        if candidate is None:
+            candidate = session.scalar(
+                select(PlagiarismJob.id)
+                .where(claimable(now))
+                .order_by(PlagiarismJob.created_at, PlagiarismJob.id)
+                .limit(1)
+            )
+            if candidate is None:
+                return None
+
+        result = session.execute(
+            update(PlagiarismJob)
+            .where(PlagiarismJob.id == candidate, claimable(now))
+            .values(
+                status="processing",
+                lease_owner=owner,
+                lease_expires_at=now + timedelta(seconds=LEASE_SECONDS),
+                attempts=PlagiarismJob.attempts + 1,
+            )
+        )
+        session.commit()
+
+        if result.rowcount == 1:
+            return candidate
+        if job_id is not None:
+            return None
+    return None
+
+
+def extend_leases(session, owner: str, job_ids):
+    if not job_ids:
+        return
+    session.execute(
+        update(PlagiarismJob)
+        .where(
+            PlagiarismJob.id.in_(list(job_ids)),
+            PlagiarismJob.lease_owner == owner,
+            PlagiarismJob.status == "processing",
+        )
+        .values(lease_expires_at=datetime.utcnow() + timedelta(seconds=LEASE_SECONDS))
+    )
+    session.commit()
+
+
+def fail_exhausted(session):
+    # Jobs whose worker died on their last attempt are not reclaimed
+    now = datetime.utcnow()
+    session.execute(
+        update(PlagiarismJob)
+        .where(
+            PlagiarismJob.status == "processing",
+            PlagiarismJob.lease_expires_at < now,
+            PlagiarismJob.attempts >= MAX_ATTEMPTS,
+        )
+        .values(
+            status="failed",
+            lease_owner=None,
+            lease_expires_at=None,
+            completed_at=now,
+            last_error="Lease expired on final attempt",
+        )
+    )
+    session.commit()
+
+
+def release_failed(session, job_id: int, owner: str, error: str, delay: float | None = None) -> bool:
+    """Requeue with exponential backoff (or after delay seconds), or fail
+    after MAX_ATTEMPTS. Returns True if the job was requeued."""
+    job = session.get(PlagiarismJob, job_id)
+    if job is None or job.lease_owner != owner:
+        return False
+
+    now = datetime.utcnow()
+    job.last_error = error[:2000]
+    job.lease_owner = None
+    job.lease_expires_at = None
+
+    requeued = job.attempts < MAX_ATTEMPTS
+    if not requeued:
+        job.status = "failed"
+        job.completed_at = now
+    else:
+        if delay is None:
+            delay = BACKOFF_SECONDS * 2 ** (job.attempts - 1)
+        job.status = "queued"
+        job.next_attempt_at = now + timedelta(seconds=delay)
+    session.commit()
+    return requeued
+
+
+# ----------------------------------------
+# Running jobs
+# ----------------------------------------
+def run_claimed_job(job_id: int, owner: str) -> str | None:
+    """Process a leased job; returns an error message on failure."""
+    with SessionLocal() as session:
+        job = session.get(PlagiarismJob, job_id)
+        if job is None or job.lease_owner != owner:
+            return None
+
+        try:
+            report = plagiarism.analyze_job(session, job)
+        except Exception as exc:
+            logger.exception("Plagiarism job %s failed", job_id)
+            session.rollback()
+            return f"{type(exc).__name__}: {exc}"
+
+        # Only the current lease holder may complete the job
+        session.refresh(job, with_for_update=True)
+        if job.lease_owner != owner:
+            session.rollback()
+            return None
+
+        plagiarism.complete_job(session, job, report)
+        job.lease_owner = None
+        job.lease_expires_at = None
+        job.last_error = None
+        session.commit()
+    return None
+
+
+@contextmanager
+def renewing_lease(owner: str, job_id: int):
+    """Keep extending the lease on job_id from a thread until the block ends."""
+    stop = threading.Event()
+
+    def heartbeat():
+        while not stop.wait(HEARTBEAT_SECONDS or 1):
+            try:
+                with SessionLocal() as session:
+                    extend_leases(session, owner, [job_id])
+            except Exception:
+                logger.exception("Could not extend the lease on job %s", job_id)
+
+    thread = threading.Thread(target=heartbeat, name=f"lease-{job_id}", daemon=True)
+    thread.start()
+    try:
+        yield
+    finally:
+        stop.set()
+        thread.join()
+
+
+def process_job(job_id: int):
+    """Run one job in the calling process (used by the API when inline
+    processing is enabled); safe alongside running workers.
+
+    Failures are retried here, up to MAX_ATTEMPTS, so a job never waits
+    on a worker that may not be running; if one is, it can pick up the
+    retry instead.
+    """
+    while True:
+        owner = new_owner("inline")
+        with SessionLocal() as session:
+            if claim_job(session, owner, job_id) is None:
+                return
+        hub.notify(job_id)
+
+        # Long analyses must not look abandoned to a running worker
+        with renewing_lease(owner, job_id):
+            error = run_claimed_job(job_id, owner)
+        if not error:
+            break
+        with SessionLocal() as session:
+            requeued = release_failed(session, job_id, owner, error, delay=INLINE_RETRY_SECONDS)
+        hub.notify(job_id)
+        if not requeued:
+            return
+        time.sleep(INLINE_RETRY_SECONDS)
+    hub.notify(job_id)
+
+
+def init_process():
+    # Connections inherited from the parent must not be shared
+    engine.dispose(close=False)
+
+
+# ----------------------------------------
+# Dispatcher
+# ----------------------------------------
+class Worker:
+    def __init__(self, processes: int = WORKER_PROCESSES):
+        self.processes = processes
+        self.owner = new_owner()
+        self.stopping = False
+        self._wake = threading.Event()
+
+    def stop(self, *args):
+        logger.info("Stopping after running jobs finish")
+        self.stopping = True
+        self._wake.set()
+
+    def new_executor(self):
+        return ProcessPoolExecutor(max_workers=self.processes, initializer=init_process)
+
+    def run(self, once: bool = False):
+        executor = self.new_executor()
+        running = {}
+        last_heartbeat = datetime.utcnow()
+        logger.info("Worker %s started with %s processes", self.owner, self.processes)
+
+        try:
+            while True:
+                claimed = 0
+                with SessionLocal() as session:
+                    while not self.stopping and len(running) < self.processes:
+                        job_id = claim_job(session, self.owner)
+                        if job_id is None:
+                            break
+                        running[executor.submit(run_claimed_job, job_id, self.owner)] = job_id
+                        claimed += 1
+
+                    now = datetime.utcnow()
+                    if (now - last_heartbeat).total_seconds() >= HEARTBEAT_SECONDS:
+                        extend_leases(session, self.owner, running.values())
+                        fail_exhausted(session)
+                        last_heartbeat = now
+
+                if not running:
+                    if self.stopping or (once and not claimed):
+                        break
+                    wait_for = POLL_SECONDS
+                else:
+                    wait_for = min(POLL_SECONDS, HEARTBEAT_SECONDS)
+
+                if running:
+                    done, _ = wait(list(running), timeout=wait_for, return_when=FIRST_COMPLETED)
+                else:
+                    done = set()
+                    self._wake.wait(wait_for)
+
+                broken = False
+                for future in done:
+                    job_id = running.pop(future)
+                    try:
+                        error = future.result()
+                    except BrokenProcessPool as exc:
+                        error = f"Worker process died: {exc}"
+                        broken = True
+                    except Exception as exc:
+                        error = f"{type(exc).__name__}: {exc}"
+
+                    if error:
+                        with SessionLocal() as session:
+                            release_failed(session, job_id, self.owner, error)
+
+                if broken:
+                    executor.shutdown(wait=False, cancel_futures=True)
+                    executor = self.new_executor()
+        finally:
+            executor.shutdown(wait=True)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="AcadFlow plagiarism job worker")
+    parser.add_argument("--processes", type=int, default=WORKER_PROCESSES)
+    parser.add_argument(
+        "--once", action="store_true", help="exit when the queue is empty"
+    )
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(name)s %(message)s")
+
+    import models
+    import migrations
+
+    models.Base.metadata.create_all(bind=engine)
+    migrations.run_migrations(engine)
+
+    worker = Worker(args.processes)
+    signal.signal(signal.SIGINT, worker.stop)
+    signal.signal(signal.SIGTERM, worker.stop)
+    worker.run(once=args.once)